@@ -0,0 +1,10 @@
+from django.contrib import admin
+
+from .models import AlignmentJob
+
+
+@admin.register(AlignmentJob)
+class AlignmentJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'progress', 'score', 'worker', 'created', 'finished')
+    list_filter = ('status',)
+    readonly_fields = ('created', 'started', 'finished')
@@ -0,0 +1,32 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from jobs import runner
+
+
+class Command(BaseCommand):
+    help = ('Run queued alignment jobs, at most MSA_JOB_WORKERS at a time, until stopped. '
+            'Run one such worker per deployment; jobs it is running when stopped are queued '
+            'again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Jobs run at once (default: settings.MSA_JOB_WORKERS)')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Seconds between checks of the queue')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no job is queued or running')
+
+    def handle(self, *args, **options):
+        # Stop cleanly on SIGTERM too, so running jobs go back in the queue
+        signal.signal(signal.SIGTERM, lambda signum, frame: self._stop())
+        try:
+            runner.serve(options['workers'], options['poll'], options['once'],
+                         lambda message: self.stdout.write(message))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write('Stopped')
+
+    def _stop(self):
+        raise KeyboardInterrupt
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlignmentJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('fasta', models.TextField()),
+                ('parameters', models.TextField(default='{}')),
+                ('status', models.CharField(default='queued', max_length=8, db_index=True, choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')])),
+                ('progress', models.IntegerField(default=0)),
+                ('score', models.IntegerField(null=True, blank=True)),
+                ('result', models.TextField(blank=True)),
+                ('stop_reason', models.CharField(max_length=16, blank=True)),
+                ('error', models.TextField(blank=True)),
+                ('worker', models.CharField(max_length=128, blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(null=True, blank=True)),
+                ('finished', models.DateTimeField(null=True, blank=True)),
+            ],
+        ),
+    ]
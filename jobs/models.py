@@ -0,0 +1,59 @@
+import json
+
+from django.db import models
+
+
+class AlignmentJob(models.Model):
+    """A multiple sequence alignment submitted through the API; queued jobs are claimed and
+    run by the run_queued_jobs worker (see jobs.runner)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    fasta = models.TextField()
+    # MSAGeneticAligner keyword arguments, as JSON
+    parameters = models.TextField(default='{}')
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    # Percentage of generations done
+    progress = models.IntegerField(default=0)
+    score = models.IntegerField(null=True, blank=True)
+    # Aligned rows with the names of their sequences, as JSON
+    result = models.TextField(blank=True)
+    stop_reason = models.CharField(max_length=16, blank=True)
+    # Exception class and message of a failed job; the traceback is only logged
+    error = models.TextField(blank=True)
+    # Host and process id of the process running the job
+    worker = models.CharField(max_length=128, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return 'Alignment job %d (%s)' % (self.pk, self.status)
+
+    def status_dict(self):
+        """Status fields reported by the API."""
+        status = {
+            'id': self.pk,
+            'status': self.status,
+            'progress': self.progress,
+            'created': self.created.isoformat(),
+            'started': self.started.isoformat() if self.started else None,
+            'finished': self.finished.isoformat() if self.finished else None,
+        }
+        if self.status == self.FAILED:
+            status['error'] = self.error
+        return status
+
+    def result_dict(self):
+        """Result fields reported by the API, for a finished job."""
+        result = json.loads(self.result)
+        result.update({'id': self.pk, 'score': self.score, 'stop_reason': self.stop_reason})
+        return result
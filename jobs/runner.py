@@ -0,0 +1,225 @@
+"""Runs alignment jobs outside the web server, with the database as the queue.
+
+The API only inserts AlignmentJob rows.  The run_queued_jobs management command is the
+worker: it claims queued rows one at a time with an atomic compare-and-set update, and runs
+each claimed job in its own freshly started ('spawn') process, at most
+settings.MSA_JOB_WORKERS at a time.  Run one worker per deployment; MSA_JOB_WORKERS is then
+the total number of jobs running at once, however many server processes take submissions.
+Queued jobs survive server and worker restarts, and jobs left running by a worker that died
+are queued again when a worker starts on the same host.
+"""
+import io
+import json
+import logging
+import math
+import multiprocessing
+import os
+import socket
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import worker
+from .models import AlignmentJob
+
+logger = logging.getLogger(__name__)
+
+# MSAGeneticAligner keyword arguments accepted from the API, with their types
+PARAMETERS = {
+    'num_seq': int,
+    'pop_size': int,
+    'generations': int,
+    'gap': int,
+    'gap_extend': int,
+    'seeding': str,
+    'patience': int,
+    'target_score': int,
+    'time_budget': float,
+    'seed': int,
+    'matrix': str,
+}
+
+# Parameters capped by a setting, with the aligner's default for when they are not given
+# (None: unbounded); the number of sequences is capped by check_records
+LIMITS = {
+    'generations': ('MSA_JOB_MAX_GENERATIONS', 500),
+    'pop_size': ('MSA_JOB_MAX_POP_SIZE', 25),
+    'time_budget': ('MSA_JOB_MAX_TIME_BUDGET', None),
+}
+
+
+def parse_parameters(data):
+    """Aligner parameters from request data, converted to their types; raises ValueError
+    on unknown, non-finite or out-of-range values.  Capped parameters that are not given get the
+    aligner's default, or the cap if that is lower (so time_budget defaults to
+    MSA_JOB_MAX_TIME_BUDGET)."""
+    parameters = {}
+    for name, kind in PARAMETERS.items():
+        if data.get(name) not in (None, ''):
+            parameters[name] = kind(data[name])
+            # float() accepts 'nan' and 'inf', which no range check below would catch
+            if kind is float and not math.isfinite(parameters[name]):
+                raise ValueError("%s must be a finite number" % name)
+    if parameters.get('matrix', 'blosum62') not in ('blosum62', 'blosum45', 'exact', 'nucleotide'):
+        raise ValueError("Unknown substitution matrix: %s" % parameters['matrix'])
+    if parameters.get('seeding', 'pairwise') not in ('pairwise', 'upgma', 'nj'):
+        raise ValueError("Unknown seeding: %s" % parameters['seeding'])
+    for name in ('generations', 'pop_size', 'time_budget'):
+        if name in parameters and parameters[name] <= 0:
+            raise ValueError("%s must be positive" % name)
+    for name, (setting, default) in LIMITS.items():
+        limit = getattr(settings, setting, None)
+        if limit is None:
+            continue
+        if name in parameters:
+            if parameters[name] > limit:
+                raise ValueError("%s must be at most %s" % (name, limit))
+        elif default is None or default > limit:
+            parameters[name] = PARAMETERS[name](limit)
+    return parameters
+
+
+def check_records(records, parameters):
+    """Raise ValueError unless the job aligns between 2 and MSA_JOB_MAX_SEQUENCES of
+    records, all written in the alphabet of the job's substitution matrix."""
+    import SubstitutionMatrix
+    num_seq = parameters.get('num_seq', len(records))
+    if not 2 <= num_seq <= len(records):
+        raise ValueError('num_seq must be between 2 and the number of records (%d)' % len(records))
+    limit = getattr(settings, 'MSA_JOB_MAX_SEQUENCES', None)
+    if limit is not None and num_seq > limit:
+        raise ValueError('At most %d sequences can be aligned' % limit)
+    alphabet = set(getattr(SubstitutionMatrix, parameters.get('matrix', 'blosum62')).alphabet)
+    for i in range(num_seq):
+        unknown = set(records[i].seq) - alphabet
+        if unknown:
+            raise ValueError('Record %s has letters outside the %s alphabet: %s'
+                             % (records[i].name, parameters.get('matrix', 'blosum62'),
+                                ''.join(sorted(unknown))))
+
+
+def run_job(job_id):
+    """Run a claimed job to completion, recording its progress, result or error."""
+    import MSA_GA
+    import SubstitutionMatrix
+    job = AlignmentJob.objects.get(pk=job_id)
+    try:
+        parameters = json.loads(job.parameters)
+        subst = getattr(SubstitutionMatrix, parameters.pop('matrix', 'blosum62'))
+        records = MSA_GA.FASTAFile(io.StringIO(job.fasta))
+
+        def progress(percent):
+            AlignmentJob.objects.filter(pk=job_id).update(progress=percent)
+
+        aligner = MSA_GA.MSAGeneticAligner(records, subst, **parameters)
+        alignment = aligner.run(progress)
+        result = {'names': [records[i].name for i in range(aligner.num_seq)],
+                  'alignment': alignment.alignment}
+        AlignmentJob.objects.filter(pk=job_id).update(
+            status=AlignmentJob.DONE, progress=100, score=alignment.score,
+            stop_reason=alignment.stop_reason or '', result=json.dumps(result),
+            finished=timezone.now())
+    except Exception as e:
+        # The traceback stays in the server log; the API only reports the exception
+        logger.exception('Alignment job %d failed', job_id)
+        AlignmentJob.objects.filter(pk=job_id).update(
+            status=AlignmentJob.FAILED, error='%s: %s' % (type(e).__name__, e),
+            finished=timezone.now())
+
+
+def worker_name(pid=None):
+    """Name recorded on the jobs a process runs: host and process id."""
+    return '%s:%d' % (socket.gethostname(), os.getpid() if pid is None else pid)
+
+
+def claim_next(name):
+    """Mark the oldest queued job as running under worker name, and return its id; None if
+    no job is queued.  The status check is part of the update, so two workers never claim
+    the same job."""
+    while True:
+        pending = list(AlignmentJob.objects.filter(status=AlignmentJob.QUEUED)
+                       .order_by('pk').values_list('pk', flat=True)[:1])
+        if not pending:
+            return None
+        claimed = AlignmentJob.objects.filter(pk=pending[0], status=AlignmentJob.QUEUED).update(
+            status=AlignmentJob.RUNNING, worker=name, progress=0, started=timezone.now())
+        if claimed:
+            return pending[0]
+
+
+def requeue(job_id):
+    """Put a running job back in the queue, to be started again from scratch."""
+    return AlignmentJob.objects.filter(pk=job_id, status=AlignmentJob.RUNNING).update(
+        status=AlignmentJob.QUEUED, worker='', progress=0, started=None)
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def recover_interrupted():
+    """Queue again the jobs left running by processes of this host that no longer exist.
+    Returns the number of jobs queued again."""
+    host = socket.gethostname() + ':'
+    count = 0
+    for job in AlignmentJob.objects.filter(status=AlignmentJob.RUNNING, worker__startswith=host):
+        pid = job.worker[len(host):]
+        if not pid.isdigit() or not _process_exists(int(pid)):
+            count += requeue(job.pk)
+    return count
+
+
+def serve(workers=None, poll_interval=1.0, once=False, log=None):
+    """Run queued jobs, at most workers (default settings.MSA_JOB_WORKERS) at a time, polling
+    the queue every poll_interval seconds.  Runs until interrupted, or with once until no job
+    is queued or running.  Jobs still running when it stops are queued again."""
+    if workers is None:
+        workers = settings.MSA_JOB_WORKERS
+    if log is None:
+        log = lambda message: None
+    # Job processes start fresh and set Django up themselves, whatever the platform default
+    context = multiprocessing.get_context('spawn')
+    name = worker_name()
+    count = recover_interrupted()
+    if count:
+        log('Queued %d interrupted job(s) again' % count)
+    running = {}
+    try:
+        while True:
+            for job_id, process in list(running.items()):
+                if process.is_alive():
+                    continue
+                process.join()
+                del running[job_id]
+                if process.exitcode != 0:
+                    # Killed, or out of memory, before it could record a result
+                    AlignmentJob.objects.filter(pk=job_id, status=AlignmentJob.RUNNING).update(
+                        status=AlignmentJob.FAILED, finished=timezone.now(),
+                        error='Job process exited with code %s' % process.exitcode)
+                log('Job %d finished' % job_id)
+            idle = True
+            while len(running) < workers:
+                job_id = claim_next(name)
+                if job_id is None:
+                    break
+                idle = False
+                process = context.Process(target=worker.run, args=(job_id,))
+                process.start()
+                running[job_id] = process
+                AlignmentJob.objects.filter(pk=job_id).update(worker=worker_name(process.pid))
+                log('Job %d started' % job_id)
+            if once and idle and not running:
+                return
+            time.sleep(poll_interval)
+    finally:
+        for job_id, process in running.items():
+            process.terminate()
+            process.join()
+            requeue(job_id)
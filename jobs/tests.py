@@ -0,0 +1,125 @@
+import json
+import subprocess
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+
+from . import runner
+from .models import AlignmentJob
+
+FASTA = '>a\nMKVLAAGIVGLLA\n>b\nMKVLAGIVGLA\n>c\nMKLAAGIVGLLA\n'
+
+
+class SubmitTests(TestCase):
+
+    def submit(self, **fields):
+        fields.setdefault('fasta', FASTA)
+        return self.client.post(reverse('job_submit'), fields)
+
+    def test_submit_queues_job(self):
+        response = self.submit(generations='20', seed='1')
+        self.assertEqual(response.status_code, 202)
+        status = json.loads(response.content.decode())
+        self.assertEqual(status['status'], AlignmentJob.QUEUED)
+        job = AlignmentJob.objects.get(pk=status['id'])
+        self.assertEqual(job.status, AlignmentJob.QUEUED)
+        self.assertEqual(json.loads(job.parameters)['generations'], 20)
+        self.assertTrue(status['status_url'].endswith(reverse('job_status', args=[job.pk])))
+
+    def test_submit_rejects_bad_input(self):
+        self.assertEqual(self.submit(fasta='>a\nMKV\n').status_code, 400)
+        self.assertEqual(self.submit(matrix='pam250').status_code, 400)
+        self.assertEqual(self.submit(num_seq='4').status_code, 400)
+        self.assertEqual(self.submit(generations='-1').status_code, 400)
+        self.assertEqual(self.submit(time_budget='nan').status_code, 400)
+        self.assertEqual(self.submit(time_budget='inf').status_code, 400)
+        self.assertEqual(self.submit(fasta=FASTA + '>d\nMKVXAGIVGLA\n').status_code, 400)
+        self.assertEqual(self.submit(matrix='nucleotide').status_code, 400)
+        self.assertFalse(AlignmentJob.objects.exists())
+
+    @override_settings(MSA_JOB_MAX_GENERATIONS=100, MSA_JOB_MAX_POP_SIZE=50,
+                       MSA_JOB_MAX_SEQUENCES=2, MSA_JOB_MAX_TIME_BUDGET=60)
+    def test_submit_enforces_limits(self):
+        self.assertEqual(self.submit(num_seq='2', generations='101').status_code, 400)
+        self.assertEqual(self.submit(num_seq='2', pop_size='51').status_code, 400)
+        self.assertEqual(self.submit(num_seq='2', time_budget='61').status_code, 400)
+        # All three records are aligned when num_seq is not given
+        self.assertEqual(self.submit().status_code, 400)
+        response = self.submit(num_seq='2')
+        self.assertEqual(response.status_code, 202)
+        job = AlignmentJob.objects.get(pk=json.loads(response.content.decode())['id'])
+        self.assertEqual(json.loads(job.parameters)['time_budget'], 60.0)
+        self.assertEqual(json.loads(job.parameters)['generations'], 100)
+        self.assertNotIn('pop_size', json.loads(job.parameters))
+
+
+class StatusResultTests(TestCase):
+
+    def create(self, **parameters):
+        parameters.setdefault('generations', 20)
+        parameters.setdefault('seed', 1)
+        return AlignmentJob.objects.create(fasta=FASTA, parameters=json.dumps(parameters))
+
+    def test_status(self):
+        job = self.create()
+        response = self.client.get(reverse('job_status', args=[job.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode())['status'], AlignmentJob.QUEUED)
+        self.assertEqual(self.client.get(reverse('job_status', args=[job.pk + 1])).status_code, 404)
+
+    def test_result_of_finished_job(self):
+        job = self.create()
+        self.assertEqual(self.client.get(reverse('job_result', args=[job.pk])).status_code, 409)
+        self.assertEqual(runner.claim_next('test:1'), job.pk)
+        runner.run_job(job.pk)
+        response = self.client.get(reverse('job_result', args=[job.pk]))
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.content.decode())
+        self.assertEqual(result['names'], ['a', 'b', 'c'])
+        self.assertEqual([row.replace('-', '') for row in result['alignment']],
+                         ['MKVLAAGIVGLLA', 'MKVLAGIVGLA', 'MKLAAGIVGLLA'])
+        self.assertEqual(result['stop_reason'], 'generations')
+
+    def test_result_of_failed_job(self):
+        job = self.create(gap='not a number')
+        runner.claim_next('test:1')
+        with self.assertLogs('jobs.runner', 'ERROR') as logs:
+            runner.run_job(job.pk)
+        self.assertIn('Traceback', logs.output[0])
+        response = self.client.get(reverse('job_result', args=[job.pk]))
+        self.assertEqual(response.status_code, 200)
+        status = json.loads(response.content.decode())
+        self.assertEqual(status['status'], AlignmentJob.FAILED)
+        # Only the exception reaches the API, not the traceback
+        self.assertNotIn('Traceback', status['error'])
+        self.assertNotIn('.py', status['error'])
+
+
+class QueueTests(TestCase):
+
+    def create(self):
+        return AlignmentJob.objects.create(fasta=FASTA)
+
+    def test_claim_in_order_once(self):
+        first = self.create()
+        second = self.create()
+        self.assertEqual(runner.claim_next('test:1'), first.pk)
+        self.assertEqual(runner.claim_next('test:2'), second.pk)
+        self.assertIsNone(runner.claim_next('test:1'))
+        first.refresh_from_db()
+        self.assertEqual(first.status, AlignmentJob.RUNNING)
+        self.assertEqual(first.worker, 'test:1')
+
+    def test_recover_interrupted(self):
+        process = subprocess.Popen(['true'])
+        process.wait()
+        dead = self.create()
+        alive = self.create()
+        runner.claim_next(runner.worker_name(process.pid))
+        runner.claim_next(runner.worker_name())
+        self.assertEqual(runner.recover_interrupted(), 1)
+        dead.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual(dead.status, AlignmentJob.QUEUED)
+        self.assertEqual(dead.worker, '')
+        self.assertEqual(alive.status, AlignmentJob.RUNNING)
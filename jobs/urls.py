@@ -0,0 +1,9 @@
+from django.conf.urls import url
+
+from . import views
+
+urlpatterns = [
+    url(r'^$', views.submit, name='job_submit'),
+    url(r'^(?P<job_id>\d+)/$', views.status, name='job_status'),
+    url(r'^(?P<job_id>\d+)/result/$', views.result, name='job_result'),
+]
@@ -0,0 +1,64 @@
+import io
+import json
+
+from django.core.urlresolvers import reverse
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from . import runner
+from .models import AlignmentJob
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+@csrf_exempt
+@require_POST
+def submit(request):
+    """Queue an alignment of the FASTA records uploaded as file 'fasta' (or sent as text
+    field 'fasta'), with aligner parameters from the other fields (see runner.PARAMETERS and
+    runner.LIMITS).  Responds 202 with the job's status and URLs."""
+    import MSA_GA
+    if 'fasta' in request.FILES:
+        fasta = request.FILES['fasta'].read().decode('ascii', 'replace')
+    else:
+        fasta = request.POST.get('fasta', '')
+    try:
+        records = MSA_GA.FASTAFile(io.StringIO(fasta))
+    except Exception as e:
+        return _error('Could not read FASTA: %s' % e)
+    if len(records) < 2:
+        return _error('At least two FASTA records are needed')
+    try:
+        parameters = runner.parse_parameters(request.POST)
+        runner.check_records(records, parameters)
+    except ValueError as e:
+        return _error(str(e))
+    # The run_queued_jobs worker picks the job up from the database
+    job = AlignmentJob.objects.create(fasta=fasta, parameters=json.dumps(parameters))
+    status = job.status_dict()
+    status['status_url'] = request.build_absolute_uri(reverse('job_status', args=[job.pk]))
+    status['result_url'] = request.build_absolute_uri(reverse('job_result', args=[job.pk]))
+    return JsonResponse(status, status=202)
+
+
+@require_GET
+def status(request, job_id):
+    """Status and progress of a job."""
+    job = get_object_or_404(AlignmentJob, pk=job_id)
+    return JsonResponse(job.status_dict())
+
+
+@require_GET
+def result(request, job_id):
+    """Alignment and score of a finished job; 409 with the status while it is queued or
+    running, and the status (with the error) if it failed."""
+    job = get_object_or_404(AlignmentJob, pk=job_id)
+    if job.status == AlignmentJob.DONE:
+        return JsonResponse(job.result_dict())
+    if job.status == AlignmentJob.FAILED:
+        return JsonResponse(job.status_dict())
+    return JsonResponse(job.status_dict(), status=409)
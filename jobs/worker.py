@@ -0,0 +1,16 @@
+"""Entry point of the processes that run alignment jobs (see runner.serve).
+
+Job processes are started with the 'spawn' method, so they inherit no state from the worker
+command: this module imports nothing from Django at load time, and sets Django up before
+touching the database.
+"""
+import os
+
+
+def run(job_id):
+    """Set Django up in a fresh process and run job job_id."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'msa_app.settings')
+    import django
+    django.setup()
+    from jobs import runner
+    runner.run_job(job_id)
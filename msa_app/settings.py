@@ -12,9 +12,13 @@ https://docs.djangoproject.com/en/1.8/ref/settings/
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
+import sys
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# The aligner modules in src import each other by module name
+sys.path.insert(0, os.path.join(BASE_DIR, 'src'))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/1.8/howto/deployment/checklist/
@@ -37,6 +41,7 @@ INSTALLED_APPS = (
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'jobs',
 )
 
 MIDDLEWARE_CLASSES = (
@@ -100,3 +105,19 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.8/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Alignment jobs
+# The run_queued_jobs worker runs at most MSA_JOB_WORKERS jobs at once; further jobs wait
+# queued in the database.  Submissions beyond the MSA_JOB_MAX_* limits are refused, and jobs
+# without a time_budget get MSA_JOB_MAX_TIME_BUDGET seconds.
+
+MSA_JOB_WORKERS = 2
+
+MSA_JOB_MAX_GENERATIONS = 5000
+
+MSA_JOB_MAX_POP_SIZE = 200
+
+MSA_JOB_MAX_SEQUENCES = 100
+
+MSA_JOB_MAX_TIME_BUDGET = 3600
@@ -0,0 +1,154 @@
+# Align many small sequence families in one invocation, spreading them over a process pool
+#
+# Usage: python BatchAlign.py [directory or manifest] [output file] [workers] [generations]
+# A directory is read for *.fasta, *.fa and *.faa files; a manifest lists one FASTA file per
+# line, optionally preceded by a family name and a tab.  Each finished family is written to
+# the output file (batch.jsonl by default) as one JSON line, in completion order, and the
+# throughput and latency summary is printed at the end.
+
+# Import
+from MSA_GA import *
+import json
+import multiprocessing
+import os
+import sys
+import time
+import numpy
+
+FASTA_EXTENSIONS = ('.fasta', '.fa', '.faa')
+
+# Families listed by a directory or manifest
+# Input: source, a directory of FASTA files or a manifest file
+# Output: list of (family name, FASTA path); a directory's files in name order, named after
+# the file without its extension
+def read_families(source):
+    families = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            (stem, extension) = os.path.splitext(name)
+            if extension.lower() in FASTA_EXTENSIONS:
+                families.append((stem, os.path.join(source, name)))
+        return families
+    directory = os.path.dirname(os.path.abspath(source))
+    with open(source) as fp:
+        for line in fp:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if '\t' in line:
+                (name, path) = line.split('\t', 1)
+            else:
+                path = line
+                name = os.path.splitext(os.path.basename(path))[0]
+            families.append((name, os.path.join(directory, path)))
+    return families
+
+# Substitution matrix, gap penalty and aligner parameters of a batch worker process, set
+# once per worker by _init_batch_worker
+_batch_subst = None
+_batch_gap = None
+_batch_params = None
+
+def _init_batch_worker(subst, gap, params):
+    global _batch_subst, _batch_gap, _batch_params
+    _batch_subst = subst
+    _batch_gap = gap
+    _batch_params = params
+
+# Align one family
+# Input: job, (index, family name, FASTA path)
+# Output: dict with the family, the names, aligned rows, score and stop reason of its
+# alignment (or the error that stopped it) and the seconds it took
+def align_family(job):
+    (index, name, path) = job
+    start = time.perf_counter()
+    result = {'family': name, 'path': path}
+    try:
+        records = FASTAFile(path)
+        # Everything is read up front; don't hold a descriptor per family
+        records.fp.close()
+        params = dict(_batch_params)
+        # Family i gets seed + i, so results do not depend on scheduling
+        if params.get('seed') is not None:
+            params['seed'] += index
+        aligned = MSAGeneticAligner(records, _batch_subst, _batch_gap, **params).run()
+        result['names'] = [records[i].name for i in range(len(aligned.alignment))]
+        result['alignment'] = aligned.alignment
+        result['score'] = aligned.score
+        result['stop_reason'] = aligned.stop_reason
+    except Exception as e:
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+# Throughput and latency of a batch
+# Input: latencies, seconds per aligned family; elapsed, wall-clock seconds of the batch;
+# failed, number of families that raised an error
+# Output: dict with jobs (families aligned), failed, seconds, jobs_per_second and latency
+# percentiles, all of aligned families only; failures usually end early and would skew them
+def batch_summary(latencies, elapsed, failed=0):
+    summary = {'jobs': len(latencies), 'failed': failed, 'seconds': elapsed,
+               'jobs_per_second': len(latencies) / elapsed if elapsed > 0 else 0.0}
+    if latencies:
+        for (label, q) in (('p50', 50), ('p90', 90), ('p99', 99), ('max', 100)):
+            summary['latency_' + label] = float(numpy.percentile(latencies, q))
+    return summary
+
+# Align every family of a directory or manifest
+# Input: source, a directory or manifest (see read_families); output, file the JSON-lines
+# results are streamed to; subst, the substitution matrix; gap, the gap penalty; workers,
+# number of processes (defaults to the number of CPUs; 1 aligns in this process); any other
+# MSAGeneticAligner parameter by keyword (generations, pop_size, seed, ...)
+# Output: dict from batch_summary
+def run_batch(source, output, subst=blosum62, gap=-4, workers=None, **params):
+    families = read_families(source)
+    jobs = [(index, families[index][0], families[index][1]) for index in range(len(families))]
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    latencies = []
+    failed = 0
+    start = time.perf_counter()
+    with open(output, 'w') as fp:
+        def write(result):
+            fp.write(json.dumps(result) + '\n')
+            fp.flush()
+            if 'error' in result:
+                return 1
+            latencies.append(result['seconds'])
+            return 0
+        if workers > 1 and len(jobs) > 1:
+            # Every worker imports the aligner and receives the matrix once; families go out
+            # one at a time, so a slow one does not hold back others queued behind it
+            pool = multiprocessing.Pool(workers, _init_batch_worker, (subst, gap, params))
+            try:
+                for result in pool.imap_unordered(align_family, jobs):
+                    failed += write(result)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            _init_batch_worker(subst, gap, params)
+            for job in jobs:
+                failed += write(align_family(job))
+    return batch_summary(latencies, time.perf_counter() - start, failed)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python BatchAlign.py [directory or manifest] [output file] [workers] [generations]")
+        sys.exit(2)
+    output = 'batch.jsonl'
+    workers = None
+    params = {}
+    if len(sys.argv) > 2:
+        output = sys.argv[2]
+    if len(sys.argv) > 3:
+        workers = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        params['generations'] = int(sys.argv[4])
+    summary = run_batch(sys.argv[1], output, workers=workers, **params)
+    print("%d families aligned (%d failed) in %.2f s: %.2f jobs/s"
+          % (summary['jobs'], summary['failed'], summary['seconds'], summary['jobs_per_second']))
+    if summary['jobs']:
+        print("Latency p50 %.3f s, p90 %.3f s, p99 %.3f s, max %.3f s"
+              % (summary['latency_p50'], summary['latency_p90'], summary['latency_p99'],
+                 summary['latency_max']))
@@ -0,0 +1,216 @@
+# Benchmarks of the alignment and genetic algorithm hot paths on synthetic data, so they run
+# offline and give the same inputs on every machine
+#
+# Usage: python Benchmark.py [output JSON file] [quick]
+#        python Benchmark.py compare [baseline JSON file] [current JSON file] [threshold]
+# The first form runs every benchmark, prints one line per benchmark and writes the results as
+# JSON (to benchmark.json by default); quick uses fewer and smaller cases.  The second form
+# flags benchmarks that got slower than the baseline by more than threshold (a fraction,
+# 0.2 by default) and exits with status 1 if any did.
+
+# Import
+from MSA_GA import *
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import numpy
+
+AMINO_ACIDS = 'ARNDCQEGHILKMFPSTWYV'
+
+# Random sequence
+# Input: length; rng, a random.Random instance; alphabet, letters to draw from
+# Output: string
+def random_sequence(length, rng, alphabet=AMINO_ACIDS):
+    return ''.join(rng.choice(alphabet) for i in range(length))
+
+# Family of related sequences: copies of one random ancestor with point substitutions,
+# insertions and deletions
+# Input: num_seq, number of sequences; length, length of the ancestor; rng, a random.Random
+# instance; rate, expected fraction of positions changed; alphabet, letters to draw from
+# Output: list of strings
+def related_sequences(num_seq, length, rng, rate=0.15, alphabet=AMINO_ACIDS):
+    ancestor = random_sequence(length, rng, alphabet)
+    seqs = []
+    for n in range(num_seq):
+        seq = list(ancestor)
+        for k in range(int(rate * length)):
+            event = rng.random()
+            if event < 0.2 and len(seq) > 1:
+                del seq[rng.randrange(len(seq))]
+            elif event < 0.4:
+                seq.insert(rng.randint(0, len(seq)), rng.choice(alphabet))
+            else:
+                seq[rng.randrange(len(seq))] = rng.choice(alphabet)
+        seqs.append(''.join(seq))
+    return seqs
+
+# Random organism with some all-gap columns, as the genetic algorithm produces them
+# Input: num_seq, number of rows; length, number of columns; rng, a random.Random instance;
+# gap_fraction, fraction of gap cells; gap_columns, number of all-gap columns
+# Output: list of aligned strings
+def random_organism(num_seq, length, rng, gap_fraction=0.2, gap_columns=None):
+    if gap_columns is None:
+        gap_columns = max(1, length // 10)
+    rows = [[GAP_CHAR if rng.random() < gap_fraction else rng.choice(AMINO_ACIDS)
+             for i in range(length)] for n in range(num_seq)]
+    for column in rng.sample(range(length), gap_columns):
+        for row in rows:
+            row[column] = GAP_CHAR
+    return [''.join(row) for row in rows]
+
+# Write sequences to a FASTA file with fixed-width lines
+def write_fasta(path, seqs, width=60):
+    with open(path, 'w') as fp:
+        for n in range(len(seqs)):
+            fp.write('>seq%d synthetic\n' % n)
+            for k in range(0, len(seqs[n]), width):
+                fp.write(seqs[n][k:k+width] + '\n')
+
+# Time a function, keeping the fastest of several runs
+# Input: function, called without arguments; repeats, number of timed runs; min_time, keep
+# running until this many seconds have been spent in total
+# Output: dict with the fastest and mean time in seconds and the number of runs
+def measure(function, repeats=3, min_time=0.05):
+    times = []
+    while len(times) < repeats or sum(times) < min_time:
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {'seconds': min(times), 'mean_seconds': sum(times) / len(times), 'runs': len(times)}
+
+def bench_nw(results, quick):
+    rng = random.Random(1)
+    lengths = [50, 100] if quick else [50, 100, 200, 400, 800]
+    for length in lengths:
+        (a, b) = related_sequences(2, length, rng)
+        for method in ('vectorized', 'hirschberg', 'banded'):
+            results['nw/%s/%d' % (method, length)] = measure(lambda: nw(a, b, blosum62, -4, method=method))
+        results['nw/affine/%d' % length] = measure(lambda: nw(a, b, blosum62, -10, gap_extend=-1))
+        # The object matrix is quadratic in Python calls; keep it to the smaller sizes
+        if length <= 200:
+            results['matrix/%d' % length] = measure(lambda: matrix(a, b, blosum62, -4), 1)
+            M = matrix(a, b, blosum62, -4)
+            results['backtrace/%d' % length] = measure(lambda: backtrace(M, a, b))
+
+def bench_fitness(results, quick):
+    rng = random.Random(2)
+    for num_seq in ([4, 8] if quick else [4, 8, 16, 32]):
+        for length in ([100] if quick else [100, 400, 1600]):
+            organism = random_organism(num_seq, length, rng)
+            name = '%d/%d' % (num_seq, length)
+            results['calc_fitness/' + name] = measure(lambda: calc_fitness(organism, blosum62, -4, length))
+            results['calc_fitness/affine/' + name] = measure(
+                lambda: calc_fitness(organism, blosum62, -10, length, gap_extend=-1))
+
+def bench_gap_blocks(results, quick):
+    rng = random.Random(3)
+    for length in ([100] if quick else [100, 400, 1600]):
+        num_seq = 8
+        organism = random_organism(num_seq, length, rng)
+        D = {0: organism}
+        results['find_gap_blocks/%d' % length] = measure(lambda: find_gap_blocks(D, 0, num_seq, length))
+        results['gap_reduction/%d' % length] = measure(
+            lambda: gap_reduction({0: list(organism)}, 0, num_seq, length, rng=random.Random(0)))
+        P = PopulationStore.Population.from_dict(D, blosum62, length)
+        results['find_gap_blocks_rows/%d' % length] = measure(lambda: find_gap_blocks_rows(P, 0, length))
+
+def bench_fasta(results, quick):
+    rng = random.Random(4)
+    num_seq = 200 if quick else 2000
+    seqs = [random_sequence(rng.randint(100, 600), rng) for n in range(num_seq)]
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'synthetic.fasta')
+    try:
+        write_fasta(path, seqs)
+        megabytes = os.path.getsize(path) / 1e6
+        def stream():
+            for record in FASTAStream(path):
+                pass
+        def indexed():
+            index = IndexedFASTA(path)
+            for record in index:
+                pass
+            index.close()
+        for (name, function) in (('FASTAFile', lambda: FASTAFile(path)), ('FASTAStream', stream),
+                                 ('IndexedFASTA', indexed)):
+            result = measure(function)
+            result['megabytes_per_second'] = megabytes / result['seconds']
+            results['fasta/%s/%d' % (name, num_seq)] = result
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+def bench_ga(results, quick):
+    rng = random.Random(5)
+    seqs = related_sequences(4 if quick else 6, 60 if quick else 120, rng)
+    generations = 20 if quick else 100
+    scores = []
+    def run():
+        scores.append(run_msa(seqs, generations=generations, seed=1).score)
+    result = measure(run, 1 if quick else 3)
+    result['score'] = scores[-1]
+    results['ga/%d/%d' % (len(seqs), generations)] = result
+
+BENCHMARKS = [bench_nw, bench_fitness, bench_gap_blocks, bench_fasta, bench_ga]
+
+# Run every benchmark
+# Input: quick, fewer and smaller cases; report, called with the name and result of each
+# benchmark as it finishes
+# Output: dict with the machine and library versions and a results dict keyed by benchmark name
+def run_benchmarks(quick=False, report=None):
+    results = {}
+    for benchmark in BENCHMARKS:
+        done = set(results)
+        benchmark(results, quick)
+        if report is not None:
+            for name in sorted(set(results) - done):
+                report(name, results[name])
+    return {'python': platform.python_version(), 'numpy': numpy.__version__,
+            'machine': platform.machine(), 'quick': quick, 'results': results}
+
+# Compare two benchmark runs
+# Input: baseline and current, dicts from run_benchmarks; threshold, the fraction by which a
+# benchmark may get slower before it is flagged
+# Output: list of (name, baseline seconds, current seconds, ratio, regressed) for the
+# benchmarks in both runs, by name
+def compare_benchmarks(baseline, current, threshold=0.2):
+    rows = []
+    for name in sorted(set(baseline['results']) & set(current['results'])):
+        before = baseline['results'][name]['seconds']
+        after = current['results'][name]['seconds']
+        ratio = after / before if before > 0 else float('inf')
+        rows.append((name, before, after, ratio, ratio > 1 + threshold))
+    return rows
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        if len(sys.argv) < 4:
+            print("Usage: python Benchmark.py compare [baseline JSON file] [current JSON file] [threshold]")
+            sys.exit(2)
+        with open(sys.argv[2]) as fp:
+            baseline = json.load(fp)
+        with open(sys.argv[3]) as fp:
+            current = json.load(fp)
+        threshold = 0.2
+        if len(sys.argv) > 4:
+            threshold = float(sys.argv[4])
+        rows = compare_benchmarks(baseline, current, threshold)
+        for (name, before, after, ratio, regressed) in rows:
+            print("%-40s %10.6f %10.6f %6.2fx%s" % (name, before, after, ratio,
+                                                     "  REGRESSION" if regressed else ""))
+        regressions = [row for row in rows if row[4]]
+        print("%d of %d benchmarks regressed by more than %d%%"
+              % (len(regressions), len(rows), round(100 * threshold)))
+        sys.exit(1 if regressions else 0)
+    output = 'benchmark.json'
+    if len(sys.argv) > 1:
+        output = sys.argv[1]
+    quick = len(sys.argv) > 2 and sys.argv[2] == 'quick'
+    report = run_benchmarks(quick, lambda name, result: print("%-40s %10.6f s" % (name, result['seconds'])))
+    with open(output, 'w') as fp:
+        json.dump(report, fp, indent=2, sort_keys=True)
@@ -0,0 +1,55 @@
+# Checkpoint files of genetic algorithm runs: named NumPy arrays plus JSON metadata, in one
+# uncompressed .npz file replaced atomically on every write
+
+# Import
+import json
+import os
+import tempfile
+import numpy
+
+CHECKPOINT_VERSION = 1
+
+# Write a checkpoint atomically: readers (and a resumed run after a crash) see either the
+# previous checkpoint or the new one, never a partial file
+# Input: path, the checkpoint file; meta, JSON-serializable dict; arrays, dict from name to
+# NumPy array
+def write_checkpoint(path, meta, arrays):
+    meta = dict(meta, version=CHECKPOINT_VERSION)
+    contents = dict(arrays)
+    contents['meta'] = numpy.frombuffer(json.dumps(meta).encode('ascii'), dtype=numpy.uint8)
+    directory = os.path.dirname(os.path.abspath(path))
+    (fd, temp) = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp',
+                                  dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            numpy.savez(fp, **contents)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+# Read a checkpoint written by write_checkpoint
+# Input: path, the checkpoint file
+# Output: (meta, arrays), as given to write_checkpoint
+def read_checkpoint(path):
+    with numpy.load(path, allow_pickle=False) as contents:
+        arrays = {name: contents[name] for name in contents.files}
+    meta = json.loads(arrays.pop('meta').tobytes().decode('ascii'))
+    if meta.get('version') != CHECKPOINT_VERSION:
+        raise ValueError("Unsupported checkpoint version %s in %s" % (meta.get('version'), path))
+    return meta, arrays
+
+# State of a random.Random as checkpoint metadata and an array
+# Input: rng, a random.Random
+# Output: (version, gauss_next, internal state as a uint32 array)
+def rng_state(rng):
+    (version, internal, gauss_next) = rng.getstate()
+    return version, gauss_next, numpy.array(internal, dtype=numpy.uint32)
+
+# Restore the state saved by rng_state
+# Input: rng, a random.Random; version, gauss_next and internal, as returned by rng_state
+def set_rng_state(rng, version, gauss_next, internal):
+    rng.setstate((version, tuple(internal.tolist()), gauss_next))
@@ -1,12 +1,18 @@
 ## A class to read FASTA files and act as a container for sequence data.
 ## @author Sara Thiebaud
 
+import array
+import mmap
+import os
+
 class FASTAFile (object):
-    """A class to represent sequence data for both proteins and nucleic acids."""
+    """A class to represent sequence data for both proteins and nucleic acids.
+    All sequences are kept back to back in one bytearray, with the name, offset and length
+    of each record in parallel lists; records are created on access and share the buffer."""
 
     def __iter__(self):
-        self._read()
-        return iter(self.records)
+        for i in range(len(self.names)):
+            yield self[i]
     
     def __init__(self, fnp):
         """Create a new instance associated with the specified file.
@@ -14,42 +20,247 @@ class FASTAFile (object):
         """
         if isinstance(fnp, str):
             self.fp = open(fnp, 'r')
-        elif isinstance(fnp, file):
+        elif hasattr(fnp, 'readline'):
             self.fp = fnp
         else:
             raise TypeError("Parameter must be a filename or file object")
 
-        self.records = []
+        self.names = []
+        self.offsets = array.array('q')
+        self.lengths = array.array('q')
+        self.buffer = bytearray()
         self._read()
+        self._view = memoryview(self.buffer)
+        # (record, id of the matrix) -> (matrix, encoded record); the matrix is kept so its
+        # id is not reused
+        self._encoded = {}
     
     def _read(self):
         ln = self.fp.readline()
         while(ln != ''):
             ln = ln.strip()
             if ln[:1] == '>':
-                name = ln[1:]
-                seq = ''
+                self.names.append(ln[1:])
+                self.offsets.append(len(self.buffer))
                 ln = self.fp.readline()
                 while ln != '' and ln[:1] != '>':
-                    seq += ln.strip()
+                    self.buffer += ln.strip().encode('ascii')
                     ln = self.fp.readline()
-                self.records.append(FastaRec(name, seq))
+                self.lengths.append(len(self.buffer) - self.offsets[-1])
             else:
                 ln = self.fp.readline()
     
     def __len__(self):
-        return len(self.records)
+        return len(self.names)
     
     def __getitem__(self, pos):
-        return self.records.__getitem__(pos)
+        if isinstance(pos, slice):
+            return [self[i] for i in range(*pos.indices(len(self.names)))]
+        if pos < 0:
+            pos += len(self.names)
+        if not 0 <= pos < len(self.names):
+            raise IndexError("FASTA record index out of range")
+        offset = self.offsets[pos]
+        return FastaRec(self.names[pos], self._view[offset:offset + self.lengths[pos]])
+
+    def encoded(self, pos, subst):
+        """Record pos as a read-only uint8 array of letter codes of subst (see
+        SubstitutionMatrix.encode), encoded on first use and kept for later calls.  Only
+        the record itself is encoded, so letters outside the alphabet in other records
+        (X, B, Z, ...) do not matter."""
+        if pos < 0:
+            pos += len(self.names)
+        if not 0 <= pos < len(self.names):
+            raise IndexError("FASTA record index out of range")
+        key = (pos, id(subst))
+        if key not in self._encoded:
+            offset = self.offsets[pos]
+            codes = subst.encode(self._view[offset:offset + self.lengths[pos]])
+            codes.flags.writeable = False
+            self._encoded[key] = (subst, codes)
+        return self._encoded[key][1]
         
-class FastaRec:
+class FastaRec (object):
+    """A named sequence, stored as bytes (or a memoryview of a FASTAFile buffer).
+    rec.seq gives the sequence as a string and rec[i] a single letter."""
+    __slots__ = ('name', 'data')
+
     def __init__(self, n, s):
         self.name = n
-        self.seq = s
+        if isinstance(s, str):
+            s = s.encode('ascii')
+        self.data = s
+
+    @property
+    def seq(self):
+        return bytes(self.data).decode('ascii')
         
     def __getitem__(self, pos):
-        return self.seq.__getitem__(pos)
+        if isinstance(pos, slice):
+            return bytes(self.data[pos]).decode('ascii')
+        return chr(self.data[pos])
+
+    def __len__(self):
+        return len(self.data)
+
+    def __bytes__(self):
+        return bytes(self.data)
+
+    def __reduce__(self):
+        # memoryviews cannot be pickled, so send a copy of the bytes
+        return (FastaRec, (self.name, bytes(self.data)))
+
+
+def _open_mmap(path):
+    """Memory-map a file read-only; None for an empty file, which cannot be mapped."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _first_record(mm):
+    """Offset of the first header line of a mapped FASTA file."""
+    if mm[:1] == b'>':
+        return 0
+    pos = mm.find(b'\n>')
+    if pos == -1:
+        return len(mm)
+    return pos + 1
+
+class FASTAStream (object):
+    """Reads records one at a time from a memory-mapped FASTA file, so only the record being
+    read is held in memory.  Each iteration scans the file again from the start."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        mm = _open_mmap(self.path)
+        if mm is None:
+            return
+        try:
+            pos = _first_record(mm)
+            size = len(mm)
+            while pos < size:
+                header_end = mm.find(b'\n', pos)
+                if header_end == -1:
+                    header_end = size
+                end = mm.find(b'\n>', header_end)
+                if end == -1:
+                    end = size
+                else:
+                    end += 1
+                name = mm[pos+1:header_end].decode('ascii').strip()
+                yield FastaRec(name, b''.join(mm[header_end+1:end].split()))
+                pos = end
+        finally:
+            mm.close()
+
+def build_fai(path):
+    """Scan a FASTA file and return its index entries as (name, length, offset, linebases,
+    linewidth) tuples, as in a samtools .fai file: name is the first word of the header,
+    offset the byte offset of the first residue, linebases the residues per line and
+    linewidth the bytes per line including the line ending."""
+    entries = []
+    mm = _open_mmap(path)
+    if mm is None:
+        return entries
+    try:
+        pos = 0
+        record = None
+        for line in iter(mm.readline, b''):
+            start = pos
+            pos += len(line)
+            if line[:1] == b'>':
+                if record is not None:
+                    entries.append(tuple(record[:5]))
+                words = line[1:].split()
+                name = words[0].decode('ascii') if words else ''
+                # name, length, offset, linebases, linewidth, seen a short line
+                record = [name, 0, pos, 0, 0, False]
+            elif record is not None:
+                bases = len(line.rstrip())
+                # Only the last line of a record may be shorter than the others (or blank)
+                if (bases and record[5]) or bases > record[3] > 0 or \
+                   (bases and bases == record[3] and len(line) != record[4]):
+                    raise ValueError("Different line lengths in FASTA record %s; cannot index it"
+                                     % record[0])
+                if record[3] == 0 and bases:
+                    record[3] = bases
+                    record[4] = len(line)
+                elif bases < record[3] or bases == 0:
+                    record[5] = True
+                record[1] += bases
+        if record is not None:
+            entries.append(tuple(record[:5]))
+    finally:
+        mm.close()
+    return entries
+
+def write_fai(entries, fai_path):
+    """Write index entries from build_fai to a .fai file."""
+    with open(fai_path, 'w') as f:
+        for entry in entries:
+            f.write('%s\t%d\t%d\t%d\t%d\n' % entry)
+
+def read_fai(fai_path):
+    """Read index entries from a .fai file."""
+    entries = []
+    with open(fai_path, 'r') as f:
+        for ln in f:
+            fields = ln.rstrip('\n').split('\t')
+            if len(fields) >= 5:
+                entries.append((fields[0],) + tuple(int(x) for x in fields[1:5]))
+    return entries
+
+class IndexedFASTA (object):
+    """Random access to the records of a memory-mapped FASTA file through a .fai-style index.
+    Records are found by position (seqs[i]) or by name (seqs['HBA_HUMAN']), reading only the
+    bytes of that record.  Names are the first word of each header line."""
+
+    def __init__(self, path, fai_path=None):
+        """Open path, reading its index from fai_path (path + '.fai' by default), or building
+        and writing the index there if it does not exist yet."""
+        if fai_path is None:
+            fai_path = path + '.fai'
+        if os.path.exists(fai_path):
+            entries = read_fai(fai_path)
+        else:
+            entries = build_fai(path)
+            write_fai(entries, fai_path)
+        self.path = path
+        self.names = [entry[0] for entry in entries]
+        self.entries = entries
+        self.positions = {}
+        for i in range(len(entries)):
+            self.positions.setdefault(entries[i][0], i)
+        self.mm = _open_mmap(path)
 
     def __len__(self):
-        return len(self.seq)
+        return len(self.entries)
+
+    def __iter__(self):
+        for i in range(len(self.entries)):
+            yield self[i]
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def __getitem__(self, pos):
+        if isinstance(pos, str):
+            pos = self.positions[pos]
+        elif pos < 0:
+            pos += len(self.entries)
+        if not 0 <= pos < len(self.entries):
+            raise IndexError("FASTA record index out of range")
+        name, length, offset, linebases, linewidth = self.entries[pos]
+        if length == 0:
+            return FastaRec(name, '')
+        full_lines, rest = divmod(length, linebases)
+        raw = self.mm[offset:offset + full_lines*linewidth + rest]
+        return FastaRec(name, b''.join(raw.split()))
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
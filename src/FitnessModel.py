@@ -0,0 +1,123 @@
+# Incremental sum-of-pairs fitness for organisms of the genetic algorithm
+
+# Import
+import collections
+import hashlib
+import numpy
+from HelperFunctions import calc_fitness, encode_organism, sp_columns
+
+class FitnessModel:
+    """Caches the per-pair, per-column score contributions of each organism so gap
+    mutations only rescore what they change.  Keys are the Population keys.  Organisms scored
+    from scratch are also looked up by content in a bounded LRU memo, so offspring identical
+    to a recently scored organism are not rescored; hits and misses count its lookups."""
+    def __init__(self, subst, gap, verify=False, legacy=False, gap_extend=None, cache_size=128):
+        """Create a model for the given substitution matrix and gap penalties, scoring as
+        calc_fitness does with the same legacy flag and gap_extend.  With verify, every score
+        is checked against a full calc_fitness and a mismatch raises AssertionError.
+        cache_size is the number of organisms memoized by content (0 disables the memo)."""
+        self.subst = subst
+        self.gap = gap
+        self.verify = verify
+        self.legacy = legacy
+        self.gap_extend = gap_extend
+        self.contributions = {}
+        self.cache_size = cache_size
+        self.memo = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _pairs(self, organism):
+        for i in range(len(organism)):
+            for j in range(i+1, len(organism)):
+                yield i, j
+
+    def _total(self, key, organism, max_len):
+        # Columns past the cached width are trailing padding gaps and score 0
+        total = int(self.contributions[key][:, :max_len].sum())
+        if self.verify:
+            full = calc_fitness(organism, self.subst, self.gap, max_len, self.legacy, self.gap_extend)
+            if full != total:
+                raise AssertionError("Incremental fitness %d of organism %s does not match calc_fitness %d"
+                                     % (total, key, full))
+        return total
+
+    def _rescore_pairs(self, C, organism, first):
+        # Only legacy scores depend on a column's position: pairs (i, j) with j at or past
+        # first now compare against a shifted reference letter in row i
+        if not self.legacy or first >= len(organism):
+            return C
+        columns = sp_columns(self._encode(organism, C.shape[1]), self.subst, self.gap, self.legacy)
+        n = 0
+        for i, j in self._pairs(organism):
+            if j >= first:
+                C[n, :] = columns[n, :C.shape[1]]
+            n += 1
+        return C
+
+    def _encode(self, organism, width=None):
+        codes = encode_organism(organism, self.subst, width)
+        # Legacy scores read row i's letter in column j, which may be an implicit trailing gap
+        # of an organism narrower than its number of rows
+        if self.legacy and codes.shape[1] < len(organism):
+            codes = encode_organism(codes, self.subst, len(organism))
+        return codes
+
+    def _digest(self, codes):
+        return (codes.shape, hashlib.blake2b(numpy.ascontiguousarray(codes).data,
+                                             digest_size=16).digest())
+
+    def score(self, key, organism, max_len):
+        """Score an organism from scratch, or from the memo if an identical organism was
+        scored recently, and cache its contributions under key."""
+        # Columns past the longest row are padding gaps in every row
+        codes = self._encode(organism)
+        if self.cache_size <= 0:
+            self.contributions[key] = sp_columns(codes, self.subst, self.gap, self.legacy,
+                                                 self.gap_extend)
+            return self._total(key, organism, max_len)
+        digest = self._digest(codes)
+        if digest in self.memo:
+            self.hits += 1
+            self.memo.move_to_end(digest)
+        else:
+            self.misses += 1
+            self.memo[digest] = sp_columns(codes, self.subst, self.gap, self.legacy,
+                                           self.gap_extend)
+            if len(self.memo) > self.cache_size:
+                self.memo.popitem(last=False)
+        # Gap mutations change cached contributions in place, so every key gets its own copy
+        self.contributions[key] = self.memo[digest].copy()
+        return self._total(key, organism, max_len)
+
+    def cache_info(self):
+        """Hits, misses and current size of the content memo."""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.memo),
+                'cache_size': self.cache_size}
+
+    def copy(self, key, new_key, organism, max_len):
+        """Cache an identical copy of organism key under new_key."""
+        self.contributions[new_key] = self.contributions[key].copy()
+        return self._total(new_key, organism, max_len)
+
+    def discard(self, key):
+        """Forget the contributions of an organism removed from the population."""
+        del self.contributions[key]
+
+    def insert_gap_column(self, key, new_key, organism, pos, max_len):
+        """Score organism, which is organism key with an all-gap column inserted at pos
+        (gap_addition, gap_extension), and cache it under new_key in place of key."""
+        C = self.contributions.pop(key)
+        if pos <= C.shape[1]:
+            C = numpy.insert(C, pos, 0, axis=1)
+        self.contributions[new_key] = self._rescore_pairs(C, organism, pos)
+        return self._total(new_key, organism, max_len)
+
+    def delete_gap_column(self, key, new_key, organism, pos, max_len):
+        """Score organism, which is organism key with the all-gap column pos removed and a
+        gap column appended (gap_reduction), and cache it under new_key in place of key."""
+        C = self.contributions.pop(key)
+        if pos < C.shape[1]:
+            C = numpy.delete(C, pos, axis=1)
+        self.contributions[new_key] = self._rescore_pairs(C, organism, pos)
+        return self._total(new_key, organism, max_len)
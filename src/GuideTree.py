@@ -0,0 +1,185 @@
+# Guide-tree progressive alignment, used to seed the genetic algorithm with a good alignment
+# instead of randomly offset pairwise rows
+
+# Import
+from HelperFunctions import *
+import random
+import numpy
+
+# Trees are nested tuples: a leaf is a sequence index, an inner node a (left, right) pair
+
+# Distance matrix from the initial pairwise alignments
+# Input: Alignments, dict from initial_pairwise_alignments; num_seq, number of sequences;
+# subst, the substitution matrix; gap, the gap penalty; gap_extend, the gap extension penalty
+# (None for linear gaps)
+# Output: num_seq by num_seq float array, 1 - score / mean self score of each pair (0 for
+# identical sequences), clipped at 0
+def pairwise_distances(Alignments, num_seq, subst, gap, gap_extend=None):
+    # Alignments is keyed (sequence index, pair index); the two rows of a pair share its index
+    pairs = {}
+    for (i, n) in sorted(Alignments):
+        pairs.setdefault(n, []).append(i)
+    self_scores = [0] * num_seq
+    for (i, n) in Alignments:
+        codes = subst.encode(Alignments[(i, n)].replace(GAP_CHAR, ''))
+        self_scores[i] = int(subst.table[codes, codes].sum())
+    D = numpy.zeros([num_seq, num_seq])
+    for n in pairs:
+        (i, j) = pairs[n]
+        score = calc_fitness([Alignments[(i, n)], Alignments[(j, n)]], subst, gap,
+                             len(Alignments[(i, n)]), gap_extend=gap_extend)
+        mean_self = max((self_scores[i] + self_scores[j]) / 2.0, 1.0)
+        D[i, j] = D[j, i] = max(0.0, 1.0 - score / mean_self)
+    return D
+
+# UPGMA guide tree: repeatedly join the two closest clusters, averaging distances by size
+# Input: D, distance matrix
+# Output: tree
+def upgma(D):
+    D = numpy.array(D, dtype=float)
+    nodes = list(range(len(D)))
+    sizes = [1] * len(D)
+    numpy.fill_diagonal(D, numpy.inf)
+    while len(nodes) > 1:
+        (i, j) = numpy.unravel_index(numpy.argmin(D), D.shape)
+        (i, j) = (min(i, j), max(i, j))
+        merged = (sizes[i] * D[i] + sizes[j] * D[j]) / (sizes[i] + sizes[j])
+        # The joined cluster takes row i; row j is dropped
+        D[i, :] = merged
+        D[:, i] = merged
+        D[i, i] = numpy.inf
+        D = numpy.delete(numpy.delete(D, j, axis=0), j, axis=1)
+        nodes[i] = (nodes[i], nodes[j])
+        sizes[i] += sizes[j]
+        del nodes[j]
+        del sizes[j]
+    return nodes[0]
+
+# Neighbor-joining guide tree, rooted at the last join
+# Input: D, distance matrix
+# Output: tree
+def neighbor_joining(D):
+    D = numpy.array(D, dtype=float)
+    nodes = list(range(len(D)))
+    while len(nodes) > 2:
+        r = len(nodes)
+        totals = D.sum(axis=1)
+        Q = (r - 2) * D - totals[:, numpy.newaxis] - totals[numpy.newaxis, :]
+        numpy.fill_diagonal(Q, numpy.inf)
+        (i, j) = numpy.unravel_index(numpy.argmin(Q), Q.shape)
+        (i, j) = (min(i, j), max(i, j))
+        merged = (D[i] + D[j] - D[i, j]) / 2.0
+        D[i, :] = merged
+        D[:, i] = merged
+        D[i, i] = 0.0
+        D = numpy.delete(numpy.delete(D, j, axis=0), j, axis=1)
+        nodes[i] = (nodes[i], nodes[j])
+        del nodes[j]
+    if len(nodes) == 2:
+        return (nodes[0], nodes[1])
+    return nodes[0]
+
+# Letter counts of every column of a profile
+# Input: profile, rows by length uint8 array of letter codes; k, number of codes
+# Output: length by k int64 array
+def column_counts(profile, k):
+    counts = numpy.zeros([profile.shape[1], k], dtype=numpy.int64)
+    for row in profile:
+        counts[numpy.arange(profile.shape[1]), row] += 1
+    return counts
+
+# Align two profiles, scoring columns by sum of pairs with linear gaps
+# Input: A and B, rows by length uint8 arrays of letter codes; subst, the substitution matrix;
+# gap, the gap penalty
+# Output: rows of A followed by rows of B, as one aligned uint8 array
+def align_profiles(A, B, subst, gap):
+    k = subst.table.shape[0]
+    # Residue against gap pairs cost gap; gap against gap is free
+    table = subst.table.astype(numpy.int64)
+    table[GAP_CODE, 1:] = gap
+    table[1:, GAP_CODE] = gap
+    countsA = column_counts(A, k)
+    countsB = column_counts(B, k)
+    pair_scores = countsA.dot(table).dot(countsB.T)
+    # Aligning a column against an all-gap column of the other profile
+    vertical = gap * len(B) * (len(A) - countsA[:, GAP_CODE])
+    horizontal = gap * len(A) * (len(B) - countsB[:, GAP_CODE])
+    m = A.shape[1]
+    n = B.shape[1]
+    P = numpy.empty([m+1, n+1], dtype=numpy.uint8)
+    P[0, :] = PTR_HORIZ
+    P[:, 0] = PTR_VERT
+    steps = numpy.concatenate(([0], numpy.cumsum(horizontal)))
+    prev = steps.copy()
+    for i in range(1, m+1):
+        diagonal_score = prev[:-1] + pair_scores[i-1]
+        vertical_score = prev[1:] + vertical[i-1]
+        take_diagonal = diagonal_score >= vertical_score
+        best = numpy.where(take_diagonal, diagonal_score, vertical_score)
+        row = numpy.empty(n+1, dtype=numpy.int64)
+        row[0] = prev[0] + vertical[i-1]
+        row[1:] = best
+        row = numpy.maximum.accumulate(row - steps) + steps
+        P[i, 1:] = numpy.where(row[1:] > best, PTR_HORIZ,
+                               numpy.where(take_diagonal, PTR_DIAG, PTR_VERT))
+        prev = row
+    moves = numpy.array(path_moves(P), dtype=numpy.uint8)
+    aligned = numpy.full([len(A) + len(B), len(moves)], GAP_CODE, dtype=numpy.uint8)
+    aligned[:len(A), moves != PTR_HORIZ] = A
+    aligned[len(A):, moves != PTR_VERT] = B
+    return aligned
+
+# Progressive alignment of sequences along a guide tree
+# Input: seqs, the sequences; tree, guide tree over their indices; subst, the substitution
+# matrix; gap, the gap penalty
+# Output: list of aligned strings, in sequence index order
+def progressive_alignment(seqs, tree, subst, gap):
+    def align(node):
+        if not isinstance(node, tuple):
+            return [node], subst.encode(seqs[node])[numpy.newaxis, :]
+        (left_rows, left) = align(node[0])
+        (right_rows, right) = align(node[1])
+        return left_rows + right_rows, align_profiles(left, right, subst, gap)
+    (rows, aligned) = align(tree)
+    order = numpy.argsort(rows)
+    return [subst.decode(aligned[r]) for r in order]
+
+# Copy of an alignment with a few gaps moved one column over, keeping each row's residues in order
+# Input: organism, list of aligned strings; moves, number of gap moves; rng, the random module
+# or a random.Random instance
+# Output: list of aligned strings
+def perturb(organism, moves, rng=random):
+    rows = [list(row) for row in organism]
+    for n in range(moves):
+        row = rows[rng.randint(0, len(rows)-1)]
+        # Gap and residue neighbours that can swap
+        edges = [k for k in range(len(row)-1) if (row[k] == GAP_CHAR) != (row[k+1] == GAP_CHAR)]
+        if edges:
+            k = rng.choice(edges)
+            (row[k], row[k+1]) = (row[k+1], row[k])
+    return [''.join(row) for row in rows]
+
+# Create an initial population from a guide-tree progressive alignment and perturbed copies of it
+# Input: Alignments, dict from initial_pairwise_alignments; seqs, the sequences; pop_size,
+# num_seq, as for initial_population; subst, the substitution matrix; gap, the gap penalty
+# (also the linear gap cost of the progressive alignment); tree, 'upgma' or 'nj'; max_moves,
+# the largest number of gap moves of a perturbed copy; rng, the random module or a
+# random.Random instance; gap_extend, the gap extension penalty of the distances
+# Output: Population, dict of organisms as from initial_population; organism 0 is the
+# unperturbed progressive alignment
+def guide_tree_population(Alignments, seqs, pop_size, num_seq, subst, gap, tree='upgma',
+                          max_moves=None, rng=random, gap_extend=None):
+    D = pairwise_distances(Alignments, num_seq, subst, gap, gap_extend)
+    if tree == 'upgma':
+        guide = upgma(D)
+    elif tree == 'nj':
+        guide = neighbor_joining(D)
+    else:
+        raise ValueError("Unknown guide tree: %s" % tree)
+    seed = progressive_alignment(seqs, guide, subst, gap)
+    if max_moves is None:
+        max_moves = max(1, len(seed[0]) // 10)
+    Population = {0: seed}
+    for i in range(1, pop_size):
+        Population[i] = perturb(seed, rng.randint(1, max_moves), rng)
+    return Population
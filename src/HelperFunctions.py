@@ -5,48 +5,205 @@ import os
 from NeedlemanWunsch import *
 import random
 import operator
+import multiprocessing
+import numpy
 
-def initial_pairwise_alignments(seqs, num_seq, subst, gap):
-    # Create initial population from pairwise sequence alignments                               
-    Alignments = {}
-    n = 0
+# Functions that draw random numbers take rng, the random module or a random.Random instance
+
+# Sequences, substitution matrix, gap penalties and nw() method and band of a pairwise
+# alignment worker process, set once per worker by _init_pair_worker
+_pair_seqs = None
+_pair_subst = None
+_pair_gap = None
+_pair_method = 'auto'
+_pair_band = None
+_pair_gap_extend = None
+
+def _init_pair_worker(seqs, subst, gap, method='auto', band=None, gap_extend=None):
+    global _pair_seqs, _pair_subst, _pair_gap, _pair_method, _pair_band, _pair_gap_extend
+    _pair_seqs = seqs
+    _pair_subst = subst
+    _pair_gap = gap
+    _pair_method = method
+    _pair_band = band
+    _pair_gap_extend = gap_extend
+
+def _align_pair(pair):
+    return nw(_pair_seqs[pair[0]], _pair_seqs[pair[1]], _pair_subst, _pair_gap,
+              method=_pair_method, band=_pair_band, gap_extend=_pair_gap_extend)
+
+# Create initial population from pairwise sequence alignments
+# Input: seqs, the sequences; num_seq, how many of them to align; subst, the substitution
+# matrix; gap, the gap penalty; workers, number of processes (1 aligns serially in this
+# process); chunksize, number of pairs handed to a worker at a time; method and band, passed
+# to nw() ('auto' switches to linear memory for long sequences, 'banded' fills only a band
+# around the diagonal, for similar sequences); gap_extend, the gap extension penalty of
+# affine gaps (None for linear gaps); cache, a PairwiseCache
+# (see PairwiseCache.py) to look pairs up in before aligning them and to store new ones in
+# Output: Alignments, dict keyed by (sequence index, pair index); identical for any workers
+def initial_pairwise_alignments(seqs, num_seq, subst, gap, workers=1, chunksize=8,
+                                method='auto', band=None, gap_extend=None, cache=None):
+    pairs = []
     for i in range(num_seq-1):
         for j in range(i+1, num_seq):
-            seq1 = seqs[i]
-            seq2 = seqs[j]
-            (aligned1, aligned2) = nw(seq1, seq2, subst, gap)
-            Alignments[(i, n)] = aligned1
-            Alignments[(j, n)] = aligned2
-            n += 1
+            pairs.append((i, j))
+    aligned = [None] * len(pairs)
+    if cache is not None:
+        keys = [cache.key(seqs[i], seqs[j], subst, gap, gap_extend, method, band) for (i, j) in pairs]
+        found = cache.get_many(keys)
+        for n in range(len(pairs)):
+            if keys[n] in found:
+                aligned[n] = found[keys[n]][:2]
+    todo = [pairs[n] for n in range(len(pairs)) if aligned[n] is None]
+    if workers > 1 and len(todo) > 1:
+        # Ship the sequences and matrix to each worker once; map() keeps pair order
+        pool = multiprocessing.Pool(workers, _init_pair_worker,
+                                    ([seqs[i] for i in range(num_seq)], subst, gap, method, band,
+                                     gap_extend))
+        try:
+            new = pool.map(_align_pair, todo, chunksize)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        new = [nw(seqs[i], seqs[j], subst, gap, method=method, band=band, gap_extend=gap_extend)
+               for (i, j) in todo]
+    missing = [n for n in range(len(pairs)) if aligned[n] is None]
+    for k in range(len(missing)):
+        aligned[missing[k]] = new[k]
+    if cache is not None and missing:
+        cache.put_many([(keys[n], aligned[n][0], aligned[n][1],
+                         calc_fitness(aligned[n], subst, gap, len(aligned[n][0]), gap_extend=gap_extend))
+                        for n in missing])
+    Alignments = {}
+    for n in range(len(pairs)):
+        (i, j) = pairs[n]
+        (aligned1, aligned2) = aligned[n]
+        Alignments[(i, n)] = aligned1
+        Alignments[(j, n)] = aligned2
     return Alignments
 
 
+# Sum-of-pairs scoring
+# Every pair of rows (i, j), i < j, is scored column by column:
+#   residue against residue  -> subst[residue_i, residue_j]
+#   residue against gap      -> gap
+#   gap against gap          -> 0
+# With legacy=True a residue against a gap is only charged when row i's letter in that column
+# differs from row i's letter in column j, which reproduces the scores of the original
+# calc_fitness loop (it compared organism[i][k] with organism[i][j]) exactly.
+# With affine gaps (gap_extend given) each pair is scored as its projected pairwise alignment:
+# gap against gap columns are skipped, and every run of gaps in one row against residues in
+# the other costs gap + (L-1)*gap_extend.  The opening gap of a run is charged to its first
+# column, so inserting or deleting all-gap columns leaves every other column's score unchanged.
+
+# Encode an organism as a num_seq by max_len uint8 array of letter codes
+# Input: organism, list of aligned strings or an already encoded array; subst, the substitution
+# matrix; max_len, number of columns to keep (defaults to the longest row); shorter rows are
+# padded with gaps
+# Output: uint8 array, gaps encoded as GAP_CODE
+def encode_organism(organism, subst, max_len=None):
+    if isinstance(organism, numpy.ndarray):
+        if max_len is None or max_len <= organism.shape[1]:
+            return organism[:, :max_len]
+        rows = organism
+    else:
+        rows = [subst.encode(row[:max_len]) for row in organism]
+    if max_len is None:
+        max_len = max(len(row) for row in rows)
+    codes = numpy.full([len(rows), max_len], GAP_CODE, dtype=numpy.uint8)
+    for i in range(len(rows)):
+        codes[i, :len(rows[i])] = rows[i]
+    return codes
+
+# Encode organisms of a population as a pop by num_seq by max_len uint8 array
+# Input: D, dict of organisms; keys, the organisms to encode, in order; subst, the substitution
+# matrix; max_len, number of columns to keep
+# Output: uint8 array with one encoded organism per key
+def encode_population(D, keys, subst, max_len):
+    return numpy.stack([encode_organism(D[key], subst, max_len) for key in keys])
+
+# Column scores of every pair of rows of one or more encoded organisms
+# Input: codes, uint8 array of shape (..., num_seq, length); subst, the substitution matrix;
+# gap, the gap penalty (the opening penalty with affine gaps); legacy, score as the original
+# calc_fitness loop did; gap_extend, the gap extension penalty (None for linear gaps)
+# Output: int32 array of shape (..., num_seq*(num_seq-1)/2, length), pairs in (i, j) order
+def sp_columns(codes, subst, gap, legacy=False, gap_extend=None):
+    first, second = numpy.triu_indices(codes.shape[-2], 1)
+    A = codes[..., first, :]
+    B = codes[..., second, :]
+    # Gap rows and columns of the table are 0, so this only scores residue pairs
+    scores = subst.table[A, B]
+    A_gap = A == GAP_CODE
+    B_gap = B == GAP_CODE
+    one_gap = A_gap != B_gap
+    if gap_extend is not None and gap_extend != gap:
+        if legacy:
+            raise ValueError("Legacy fitness only supports linear gaps")
+        return scores + numpy.int32(gap_extend) * one_gap + numpy.int32(gap - gap_extend) * gap_opens(A_gap, B_gap)
+    if legacy:
+        # Row i's letter in column j, which is an implicit trailing gap when j is past the end
+        num_seq = codes.shape[-2]
+        if codes.shape[-1] < num_seq:
+            padded = numpy.full(codes.shape[:-1] + (num_seq,), GAP_CODE, dtype=numpy.uint8)
+            padded[..., :codes.shape[-1]] = codes
+            codes = padded
+        ref = codes[..., first, second]
+        one_gap &= A != ref[..., numpy.newaxis]
+    return scores + numpy.int32(gap) * one_gap
+
+# Columns opening a run of gaps in a pairwise projection of an alignment
+# Input: A_gap and B_gap, bool arrays of shape (..., length), the gap columns of the two rows
+# Output: bool array, True where one row has a gap and the previous column that is not a gap
+# in both rows does not have a gap in the same row
+def gap_opens(A_gap, B_gap):
+    # State of each column: 0 residue pair, 1 gap in A only, 2 gap in B only
+    state = (A_gap & ~B_gap) + 2 * (B_gap & ~A_gap).astype(numpy.int8)
+    both = A_gap & B_gap
+    # Index of the last column up to each one that is not a gap in both rows (-1 for none)
+    columns = numpy.arange(state.shape[-1])
+    last = numpy.maximum.accumulate(numpy.where(both, -1, columns), axis=-1)
+    previous = numpy.zeros_like(state)
+    previous[..., 1:] = numpy.take_along_axis(state, numpy.maximum(last[..., :-1], 0), axis=-1)
+    previous[..., 1:] *= last[..., :-1] >= 0
+    return (state != 0) & (state != previous)
+
+# Sum-of-pairs score of one or more encoded organisms
+# Input: codes, uint8 array of shape (num_seq, length) or (pop, num_seq, length); subst, the
+# substitution matrix; gap, the gap penalty; legacy, score as the original calc_fitness loop
+# did; gap_extend, the gap extension penalty (None for linear gaps)
+# Output: score of the organism, or an array with one score per organism
+def sp_score(codes, subst, gap, legacy=False, gap_extend=None):
+    return sp_columns(codes, subst, gap, legacy, gap_extend).sum(axis=(-2, -1))
+
+# Sum-of-pairs scores of the first max_len columns of organisms given as strings
+# Input: organisms, list of organisms; the rest as for sp_score
+# Output: int64 array with one score per organism
+def _string_scores(organisms, subst, gap, max_len, legacy, gap_extend):
+    width = max_len
+    if legacy:
+        # Legacy scores read row i's letter in column j, which may lie past max_len
+        width = max(max_len, len(organisms[0]))
+    codes = numpy.stack([encode_organism(organism, subst, width) for organism in organisms])
+    return sp_columns(codes, subst, gap, legacy, gap_extend)[..., :max_len].sum(axis=(-2, -1))
+
 # Calculate fitness based on sum of pairwise alignment scores                               
-def calc_fitness(organism, subst, gap, max_len):
-    total_score = 0
-    for i in range(len(organism)):
-        for j in range(i+1, len(organism)):
-            score = 0
-            for k in range(max_len):
-                if operator.xor(bool(organism[i][k] == '-'), bool(organism[j][k] == '-')):
-                    if organism[i][k] != organism[i][j]:
-                        score += gap
-                elif organism[i][k] != '-' and organism[j][k] != '-':
-                    score += subst[organism[i][k], organism[j][k]]
-            total_score += score
-    return total_score
-
-def initial_population(Alignments, pop_size, num_seq, max_offset, max_len):
+def calc_fitness(organism, subst, gap, max_len, legacy=False, gap_extend=None):
+    if len(organism) < 2:
+        return 0
+    return int(_string_scores([organism], subst, gap, max_len, legacy, gap_extend)[0])
+
+def initial_population(Alignments, pop_size, num_seq, max_offset, max_len, rng=random):
     Population = {}
     # People a population & score                                                               
     for i in range(pop_size):
         for j in range(num_seq):
-            rand_index = random.randint(0, num_seq-1)
+            rand_index = rng.randint(0, num_seq-1)
             while not (j, rand_index) in Alignments.keys():
-                rand_index = random.randint(0, num_seq-1)
+                rand_index = rng.randint(0, num_seq-1)
             chosen_seq = Alignments[(j, rand_index)]
             chosen_seq_l = list(chosen_seq)
-            offset = random.randint(0, max_offset)
+            offset = rng.randint(0, max_offset)
             for k in range(offset):
                 chosen_seq_l.insert(0, '-')
             while len(chosen_seq_l) < max_len:
@@ -58,16 +215,19 @@ def initial_population(Alignments, pop_size, num_seq, max_offset, max_len):
     return Population
 
 
-def initial_fitness(Population, pop_size, subst, gap, max_len):
+def initial_fitness(Population, pop_size, subst, gap, max_len, legacy=False, gap_extend=None):
+    # Score the whole population in one batch
+    scores = _string_scores([Population[i] for i in range(pop_size)], subst, gap, max_len,
+                            legacy, gap_extend)
     Fitness = {}
     for i in range(pop_size):
-        Fitness[i] = calc_fitness(Population[i], subst, gap, max_len)
+        Fitness[i] = int(scores[i])
     return Fitness
 
-def horizontal_recombination(D, mom, dad, num_seq):
+def horizontal_recombination(D, mom, dad, num_seq, rng=random):
     offspring = []
     for i in range(num_seq):
-        P_prob = random.randint(0, 1)
+        P_prob = rng.randint(0, 1)
         if P_prob == 0:
             offspring.append(D[mom][i])
         else:
@@ -99,36 +259,63 @@ def vertical_recombination(D, mom, dad, l, num_seq, max_len):
         offspring.append(''.join(seq_list))
     return offspring
 
-def gap_extension(D, org, num_seq, max_len):
-    gap_blocks = find_gap_blocks(D, org, num_seq, max_len)
+# Choose the column at which gap_extension inserts a gap, next to or inside a gap block;
+# None if there are no gap blocks
+def pick_gap_extension(gap_blocks, rng=random):
+    if len(gap_blocks) == 0:
+        return None
+    block = rng.randint(0, len(gap_blocks)-1)
+    return rng.randint(gap_blocks[block][0],gap_blocks[block][0]+ gap_blocks[block][1])
+
+def choose_gap_extension(D, org, num_seq, max_len, rng=random):
+    return pick_gap_extension(find_gap_blocks(D, org, num_seq, max_len), rng)
+
+def gap_extension(D, org, num_seq, max_len, pos=None, rng=random):
+    if pos is None:
+        pos = choose_gap_extension(D, org, num_seq, max_len, rng)
+    if pos is None:
+        return D[org]
     new_org = []
-    block = random.randint(0, len(gap_blocks)-1)
-    pos = random.randint(gap_blocks[block][0],gap_blocks[block][0]+ gap_blocks[block][1])
     for i in range(num_seq):
         M_seq_l = list(D[org][i])
         M_seq_l.insert(pos, '-')
         new_org.append(''.join(M_seq_l))
     return new_org
 
-def gap_addition(D, org, num_seq, max_len):
+# Choose the column at which gap_addition inserts a gap
+def choose_gap_addition(max_len, rng=random):
+    return rng.randint(0, max_len-1)
+
+def gap_addition(D, org, num_seq, max_len, pos=None, rng=random):
+    if pos is None:
+        pos = choose_gap_addition(max_len, rng)
     new_org = []
-    pos = random.randint(0, max_len-1)
     for i in range(num_seq):
         seq_l = list(D[org][i])
         seq_l.insert(pos, '-')
         new_org.append(''.join(seq_l))
     return new_org
 
-def gap_reduction(D, org, num_seq, max_len):
+# Choose the gap column that gap_reduction removes, favouring short blocks; None if there
+# are no gap blocks
+def pick_gap_reduction(blocks, max_len, rng=random):
     probs = []
-    new_org = []
-    blocks = find_gap_blocks(D, org, num_seq, max_len)
     if len(blocks) == 0:
-        return D[org]
+        return None
     for i in range(len(blocks)):
         for j in range(int(max_len / blocks[i][1])):
             probs.append(blocks[i][0])
-    pos = random.choice(probs)
+    return rng.choice(probs)
+
+def choose_gap_reduction(D, org, num_seq, max_len, rng=random):
+    return pick_gap_reduction(find_gap_blocks(D, org, num_seq, max_len), max_len, rng)
+
+def gap_reduction(D, org, num_seq, max_len, pos=None, rng=random):
+    if pos is None:
+        pos = choose_gap_reduction(D, org, num_seq, max_len, rng)
+    if pos is None:
+        return D[org]
+    new_org = []
     for j in range(num_seq):
         seq_l = list(D[org][j])
         del seq_l[pos]
@@ -136,42 +323,101 @@ def gap_reduction(D, org, num_seq, max_len):
         new_org.append(''.join(seq_l))
     return new_org
 
+# Mask of the all-gap columns of an organism
+# Input: organism, list of aligned strings; max_len, number of columns to look at
+# Output: boolean array of max_len entries, True where every row has a gap (or has ended)
+def gap_column_mask(organism, max_len):
+    mask = numpy.ones(max_len, dtype=bool)
+    gap = ord(GAP_CHAR)
+    for row in organism:
+        row = numpy.frombuffer(row[:max_len].encode('ascii'), dtype=numpy.uint8)
+        mask[:len(row)] &= row == gap
+    return mask
+
+# Runs of all-gap columns of a gap column mask
+# Input: mask, boolean array with True for all-gap columns
+# Output: list of (start, length) of each run of True entries, in column order
+def gap_blocks(mask):
+    edges = numpy.diff(numpy.concatenate(([0], mask.view(numpy.int8), [0])))
+    starts = numpy.flatnonzero(edges == 1)
+    ends = numpy.flatnonzero(edges == -1)
+    return list(zip(starts.tolist(), (ends - starts).tolist()))
+
+# Columns left once the leading and trailing all-gap columns are cut
+# Input: mask, boolean array with True for all-gap columns
+# Output: (start, end) of the columns to keep; (0, 0) if every column is a gap
+def trimmed_bounds(mask):
+    kept = numpy.flatnonzero(~mask)
+    if len(kept) == 0:
+        return (0, 0)
+    return (int(kept[0]), int(kept[-1]) + 1)
+
 def find_gap_blocks(D, org, num_seq, max_len):
-    gaps = []
-    blocks = []
-    for i in range(max_len):
-        n = []
-        for j in range(num_seq):
-            n.append(D[org][j][i])
-        if n[1:] == n[:-1] and n[0] == '-':
-            gaps.append(i)
-    block_len = 1
-    block_start = gaps[0]
-    for k in range(len(gaps)):
-        if k+1 < len(gaps) and gaps[k]+1 == gaps[k+1]:
-            block_len += 1
-        else:
-            blocks.append((block_start, block_len))
-            if k+1 < len(gaps):
-                block_start = gaps[k+1]
-            block_len = 1
-    return blocks
+    return gap_blocks(gap_column_mask(D[org][:num_seq], max_len))
 
 def trim_gaps(D, org, num_seq, max_len):
-    blocks = find_gap_blocks(D, org, num_seq, max_len)
-    new_org = []
-    for i in range(num_seq):                                        
-        seq = []
-        # Blocks at front and back
-        if blocks[0][0] == 0:
-            no_gap_start = blocks[0][0]+blocks[0][1]
-            no_gap_end = blocks[-1][0]
-        # Blocks only at back
+    (start, end) = trimmed_bounds(gap_column_mask(D[org][:num_seq], max_len))
+    return [D[org][i][start:end] for i in range(num_seq)]
+
+
+# Operators working in place on the rows of an array-backed Population (see Population.py).
+# They follow the string operators above, with columns past the end of a row read as gaps,
+# and only change the organisms they are given: no operator pads the others.
+
+def horizontal_recombination_rows(P, mom, dad, child, num_seq, rng=random):
+    for i in range(num_seq):
+        P_prob = rng.randint(0, 1)
+        if P_prob == 0:
+            P.codes[child, i] = P.codes[mom, i]
         else:
-            no_gap_start = 0
-            no_gap_end = blocks[-1][0]
-        seq_s = D[org][i][no_gap_start:no_gap_end]
-        seq.append(seq_s)
-        new_org.append(''.join(seq[0]))
-    return new_org
+            P.codes[child, i] = P.codes[dad, i]
+    P.update_gap_columns(child)
+
+# Number of columns of a row to keep before cutting it at the l-th position past its leading gaps
+def _cut_offset(row, l):
+    offset = int(numpy.argmax(row != GAP_CODE))
+    return offset + int(numpy.count_nonzero(row[offset:offset+l] == GAP_CODE))
+
+def vertical_recombination_rows(P, mom, dad, child, l, num_seq):
+    for i in range(num_seq):
+        m_offset = _cut_offset(P.codes[mom, i], l)
+        d_offset = _cut_offset(P.codes[dad, i], l)
+        # Like the string slice mom[:l+m_offset], the head stops at the end of mom's row
+        head = min(l + m_offset, int(P.lengths[mom]))
+        tail = P.codes[dad, i, l+d_offset:]
+        # The offspring row is longer than its parents when m_offset > d_offset
+        used = numpy.flatnonzero(tail)
+        if len(used):
+            P.reserve(head + int(used[-1]) + 2)
+        else:
+            P.reserve(head + 1)
+        width = min(len(tail), P.width - head)
+        P.codes[child, i, :head] = P.codes[mom, i, :head]
+        P.codes[child, i, head:head+width] = tail[:width]
+        P.codes[child, i, head+width:] = GAP_CODE
+    P.update_gap_columns(child)
+
+def gap_insertion_rows(P, org, pos):
+    # Used for both gap_addition and gap_extension; keep room for the column pushed off the end
+    if pos + 1 >= P.width or P.lengths[org] >= P.width:
+        P.reserve(max(pos + 2, P.width + 1))
+    P.codes[org, :, pos+1:] = P.codes[org, :, pos:-1].copy()
+    P.codes[org, :, pos] = GAP_CODE
+    P.gap_columns[org, pos+1:] = P.gap_columns[org, pos:-1].copy()
+    P.gap_columns[org, pos] = True
+    # A gap inserted past the last residue only moves implicit trailing gaps
+    if pos < P.lengths[org]:
+        P.lengths[org] += 1
+
+def gap_reduction_rows(P, org, pos):
+    P.codes[org, :, pos:-1] = P.codes[org, :, pos+1:].copy()
+    P.codes[org, :, -1] = GAP_CODE
+    P.gap_columns[org, pos:-1] = P.gap_columns[org, pos+1:].copy()
+    P.gap_columns[org, -1] = True
+    if pos < P.lengths[org]:
+        P.lengths[org] -= 1
 
+# Find (start, length) of each run of all-gap columns among the first max_len columns, from
+# the organism's gap column mask
+def find_gap_blocks_rows(P, org, max_len):
+    return gap_blocks(P.gap_columns[org, :max_len])
@@ -0,0 +1,111 @@
+# Per-generation profiling of the genetic algorithm
+# An MSAGeneticAligner only calls into a GenerationProfiler when one is attached, so runs
+# without one pay a single attribute check per phase and operator.
+
+# Import
+import json
+import time
+
+# Fitness model methods timed and counted as fitness evaluations
+FITNESS_METHODS = ('score', 'copy', 'insert_gap_column', 'delete_gap_column')
+
+class TimedFitnessModel:
+    """Wraps a FitnessModel, timing and counting every evaluation for a profiler; all other
+    attributes are those of the wrapped model."""
+    def __init__(self, model, profiler):
+        self.model = model
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        attribute = getattr(self.model, name)
+        if name not in FITNESS_METHODS:
+            return attribute
+        profiler = self.profiler
+        def timed(*args):
+            start = time.perf_counter()
+            try:
+                return attribute(*args)
+            finally:
+                profiler.seconds['fitness'] = profiler.seconds.get('fitness', 0.0) + time.perf_counter() - start
+                profiler.evaluations[name] = profiler.evaluations.get(name, 0) + 1
+        return timed
+
+class GenerationProfiler:
+    """Collects, for every generation, the time spent in each phase (cull, reproduce,
+    mutate, and fitness evaluation within reproduce and mutate), the number of times each
+    operator ran, the fitness evaluations by kind, the content memo hits, and the best and
+    mean fitness and max_len.  Each generation's record is passed to every callback and,
+    with a trace, written as one JSON line; totals sums the records."""
+    def __init__(self, trace=None, callbacks=()):
+        """Create a profiler; trace is a file name or an open text file for a JSON-lines
+        trace (None for no trace), callbacks functions called with each record."""
+        if isinstance(trace, str):
+            self.trace = open(trace, 'w')
+            self.owns_trace = True
+        else:
+            self.trace = trace
+            self.owns_trace = False
+        self.callbacks = list(callbacks)
+        self.records = []
+        self.totals = {'seconds': {}, 'operators': {}, 'evaluations': {}, 'cache_hits': 0,
+                       'generations': 0}
+        self._reset()
+
+    def _reset(self):
+        self.seconds = {}
+        self.operators = {}
+        self.evaluations = {}
+
+    def wrap(self, fitness_model):
+        """The fitness model to use while this profiler is attached."""
+        return TimedFitnessModel(fitness_model, self)
+
+    def begin(self, aligner):
+        """Start a generation."""
+        self._reset()
+        self.start = time.perf_counter()
+        self.cache_hits = getattr(aligner.fitness_model, 'hits', 0)
+
+    def phase(self, name, function):
+        """Run function as phase name of the current generation, timing it."""
+        start = time.perf_counter()
+        function()
+        self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, operator):
+        """Count one run of operator in the current generation."""
+        self.operators[operator] = self.operators.get(operator, 0) + 1
+
+    def end(self, aligner, stats):
+        """Finish a generation whose stats (a dict from MSAGeneticAligner.step) are given,
+        report its record and return it."""
+        self.seconds['total'] = time.perf_counter() - self.start
+        record = dict(stats)
+        record['seconds'] = self.seconds
+        record['operators'] = self.operators
+        record['evaluations'] = self.evaluations
+        record['cache_hits'] = getattr(aligner.fitness_model, 'hits', 0) - self.cache_hits
+        self.records.append(record)
+        for key in ('seconds', 'operators', 'evaluations'):
+            for name in record[key]:
+                self.totals[key][name] = self.totals[key].get(name, 0) + record[key][name]
+        self.totals['cache_hits'] += record['cache_hits']
+        self.totals['generations'] += 1
+        for callback in self.callbacks:
+            callback(record)
+        if self.trace is not None:
+            self.trace.write(json.dumps(record, sort_keys=True) + '\n')
+            self.trace.flush()
+        return record
+
+    def close(self):
+        """Close the trace file if the profiler opened it."""
+        if self.owns_trace and self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
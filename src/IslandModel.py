@@ -0,0 +1,199 @@
+# Island-model genetic algorithm: several populations evolve in parallel processes and
+# every few generations send copies of their fittest organisms to neighbouring islands
+
+# Import
+from MSA_GA import *
+import multiprocessing
+import time
+import traceback
+
+# Islands that send migrants to island index
+# Input: index, the receiving island; islands, number of islands; topology, 'ring' (each
+# island receives from the one before it) or 'full' (every island receives from all others)
+# Output: list of island indices, in increasing order
+def migration_sources(index, islands, topology):
+    if topology == 'ring':
+        if islands < 2:
+            return []
+        return [(index - 1) % islands]
+    elif topology == 'full':
+        return [i for i in range(islands) if i != index]
+    else:
+        raise ValueError("Unknown migration topology: %s" % topology)
+
+# Number of generations an island runs before each migration; the last epoch has no migration
+def _epochs(generations, interval):
+    epochs = []
+    done = 0
+    while done < generations:
+        epochs.append(min(interval, generations - done))
+        done += epochs[-1]
+    return epochs
+
+def _evolve(aligner, generations):
+    for gen in range(generations):
+        aligner.step()
+
+# What the stopping criteria need to know of an island at the end of an epoch
+def _island_state(aligner):
+    return {'best': aligner.best_score, 'stagnant': aligner.stagnant,
+            'diversity': aligner.stats[-1].get('diversity')}
+
+# Why an island run should stop at the end of an epoch, or None to go on
+# Input: states, _island_state of every island; aligner, any island's aligner (they share
+# their stopping criteria); elapsed, seconds since the islands started evolving
+# Output: 'target' if any island reached target_score, 'plateau' if no island improved in
+# patience generations, 'time' if time_budget is used up, 'diversity' if every island is at
+# or below min_diversity, or None
+def _stop_reason(states, aligner, elapsed):
+    if aligner.target_score is not None and max(s['best'] for s in states) >= aligner.target_score:
+        return 'target'
+    if aligner.patience is not None and min(s['stagnant'] for s in states) >= aligner.patience:
+        return 'plateau'
+    if aligner.time_budget is not None and elapsed >= aligner.time_budget:
+        return 'time'
+    if aligner.min_diversity is not None and max(s['diversity'] for s in states) <= aligner.min_diversity:
+        return 'diversity'
+    return None
+
+# Body of one island process; queues maps (source, destination) to the queue of that edge, so
+# migrants arrive in order from every source.  After every epoch the island reports its state
+# on results and waits on control for the coordinator's decision (a stop reason, or None to
+# go on).
+def _island_process(index, aligner, Alignments, epochs, migrants, topology, islands, queues,
+                    control, results):
+    try:
+        _island(index, aligner, Alignments, epochs, migrants, topology, islands, queues,
+                control, results)
+    except Exception:
+        results.put(('error', index, traceback.format_exc()))
+
+def _island(index, aligner, Alignments, epochs, migrants, topology, islands, queues, control,
+            results):
+    aligner.initialize(Alignments)
+    sources = migration_sources(index, islands, topology)
+    for n in range(len(epochs)):
+        _evolve(aligner, epochs[n])
+        results.put(('epoch', index, _island_state(aligner)))
+        if control.get() is not None or n == len(epochs) - 1:
+            break
+        outgoing = aligner.emigrants(migrants)
+        for destination in range(islands):
+            if index in migration_sources(destination, islands, topology):
+                queues[(index, destination)].put(outgoing)
+        for source in sources:
+            aligner.immigrate(*queues[(source, index)].get())
+    alignment, score = aligner.best()
+    results.put(('done', index, (alignment, score, aligner.stats)))
+
+# Next message from the island processes, stopping them all if one failed
+def _receive(results, workers):
+    message = results.get()
+    if message[0] == 'error':
+        # The other islands may be waiting for this one's migrants
+        for worker in workers:
+            worker.terminate()
+        raise RuntimeError("Island %d failed:\n%s" % (message[1], message[2]))
+    return message
+
+# Combine the per-generation stats of all islands
+def _merge_stats(island_stats):
+    stats = []
+    for gen in range(len(island_stats[0])):
+        rows = [s[gen] for s in island_stats]
+        stats.append({'generation': gen,
+                      'best': max(row['best'] for row in rows),
+                      'mean': sum(row['mean'] for row in rows) / float(len(rows)),
+                      'max_len': max(row['max_len'] for row in rows)})
+    return stats
+
+# Align sequences with an island-model genetic algorithm
+# Input: seqs, the sequences; subst, the substitution matrix; gap, the gap penalty; islands,
+# number of sub-populations; migration_interval, generations between migrations; migrants,
+# number of organisms each island sends per migration (they replace the receiver's least fit);
+# topology, 'ring' or 'full'; processes, run every island in its own process (otherwise all
+# islands run in turn in this process, with the same results); seed, island i is seeded with
+# seed + i; any other MSAGeneticAligner parameter by keyword (generations, pop_size, ...).
+# The stopping criteria (target_score, patience, time_budget, min_diversity) are checked for
+# all islands together at the end of every epoch (see _stop_reason); checkpoints are not
+# supported.
+# Output: MSAResult with the best alignment over all islands, its score, per-generation
+# stats combined over the islands (best of the bests, mean of the means), why it stopped and
+# the pairwise cache's stats() for runs with one
+def run_islands(seqs, subst=blosum62, gap=-4, islands=4, migration_interval=25, migrants=2,
+                topology='ring', processes=True, seed=None, **params):
+    if params.get('checkpoint') is not None:
+        raise ValueError("Island runs cannot be checkpointed")
+    aligners = []
+    for index in range(islands):
+        island_seed = None
+        if seed is not None:
+            island_seed = seed + index
+        aligners.append(MSAGeneticAligner(seqs, subst, gap, seed=island_seed, **params))
+    # Pairwise alignments are shared by every island, so compute them once
+    first = aligners[0]
+    Alignments = initial_pairwise_alignments(first.seqs, first.num_seq, subst, gap, first.workers,
+                                             method=first.pairwise_method, band=first.band,
+                                             gap_extend=first.gap_extend, cache=first.pairwise_cache)
+    epochs = _epochs(first.generations, migration_interval)
+    start = time.time()
+    reason = None
+    if processes and islands > 1:
+        queues = {}
+        for destination in range(islands):
+            for source in migration_sources(destination, islands, topology):
+                queues[(source, destination)] = multiprocessing.Queue()
+        controls = [multiprocessing.Queue() for index in range(islands)]
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_island_process,
+                                           args=(index, aligners[index], Alignments, epochs,
+                                                 migrants, topology, islands, queues,
+                                                 controls[index], results))
+                   for index in range(islands)]
+        for worker in workers:
+            worker.start()
+        for n in range(len(epochs)):
+            states = [None] * islands
+            for index in range(islands):
+                message = _receive(results, workers)
+                states[message[1]] = message[2]
+            reason = _stop_reason(states, first, time.time() - start)
+            for control in controls:
+                control.put(reason)
+            if reason is not None:
+                break
+        finished = []
+        for index in range(islands):
+            message = _receive(results, workers)
+            finished.append((message[1],) + message[2])
+        for worker in workers:
+            worker.join()
+        finished.sort(key=lambda result: result[0])
+    else:
+        for aligner in aligners:
+            aligner.initialize(Alignments)
+        for n in range(len(epochs)):
+            for aligner in aligners:
+                _evolve(aligner, epochs[n])
+            reason = _stop_reason([_island_state(aligner) for aligner in aligners], first,
+                                  time.time() - start)
+            if reason is not None or n == len(epochs) - 1:
+                break
+            # Every island emigrates before any receives, as with the processes
+            outgoing = [aligner.emigrants(migrants) for aligner in aligners]
+            for index in range(islands):
+                for source in migration_sources(index, islands, topology):
+                    aligners[index].immigrate(*outgoing[source])
+        finished = []
+        for index in range(islands):
+            alignment, score = aligners[index].best()
+            finished.append((index, alignment, score, aligners[index].stats))
+    # Global best: highest score, lowest island index among ties
+    best = max(finished, key=lambda result: (result[2], -result[0]))
+    if reason is None:
+        reason = 'generations'
+    cache_stats = None
+    if first.pairwise_cache is not None:
+        cache_stats = first.pairwise_cache.stats()
+    return MSAResult(best[1], best[2], _merge_stats([result[3] for result in finished]), reason,
+                     cache_stats)
@@ -1,189 +1,554 @@
-# Implement genetic algorithm for multple sequence alignment                                
-# Inspired by paper "A simple genetic algorithm for multiple sequence alignment"            
-# (C. Gondro & B.P. Kinghorn)                                                               
+# Implement genetic algorithm for multple sequence alignment
+# Inspired by paper "A simple genetic algorithm for multiple sequence alignment"
+# (C. Gondro & B.P. Kinghorn)
 
-# Import                                                                                    
-import os
+# Import
 from NeedlemanWunsch import *
 from HelperFunctions import *
+from FitnessModel import *
+import Population as PopulationStore
+from Selection import *
+from GuideTree import *
+from Instrumentation import *
+from PairwiseCache import *
+from Checkpoint import *
 import random
-import operator
-
-# For now, just take first three sequences from globin_fragments.fasta, use defined         
-# substitution table, gap penalty, etc.                                                     
-# Later, get input from user                                                                
-# seqs: the path to a FASTA file that contains the sequences to be aligned
-seqs = FASTAFile('globin_fragments.fasta')
-# subst: The substitution matrix to be used to align
-# For amino acid sequences, can use blosum62, blosum45, or an exact 20x20 matrix
-# For nucleotide sequences, can use an exact 4x4 matrix
-subst = blosum62
-# gap: Gap penalty for inserting any gap in the sequence (not a linear model)
-gap = -4                                                  
-# num_seq: Number of sequences to be aligned (first n in the file provided)
-num_seq = 3
-# pop_size: Size of the population
-pop_size = 25
-# generations: Number of generations
-generations = 500
-# culling_percentage: Bottom percentage to be removed from the population without 
-# reproducing for every generation
-culling_percentage = 0.4
-# num_least_fit: The number of organisms in the population that are removed
-# without reproducing
-num_least_fit = int(culling_percentage*pop_size)
-# HR_prob: The probability of a horizontal recombination event occurring
-HR_prob = 0.5
-# VR_prob: The probability of a vertical recombination event occurring
-VR_prob = 0.3
-# GE_prob: The probability of a gap extension mutation occurring
-GE_prob = 0.05
-# GA_prob: The probability of a gap addition mutation occurring
-GA_prob = 0.1
-# GR_prob: The probability of a gap reduction mutation occurring
-GR_prob = 0.05
-
-
-# Dictionary with tuple as key to hold all possible alignments                              
-Alignments = initial_pairwise_alignments(seqs, num_seq, subst, gap)
-
-# Calculate properties of sequences in Alignments
-# max_seq_len: The length of the longest of the sequences in the initial
-# population
-max_seq_len = 0
-for i in range(num_seq):
-    if len(seqs[i]) > max_seq_len:
-        max_seq_len = len(seqs[i])
-# max_offset: The maximum number of gaps to be inserted at the beginning of the
-# sequence, defined to be 20% of the length of the longest ungapped sequence
-max_offset = int(0.2*max_seq_len)
-# max_len: The maximum length of the sequences, defined to be 135% of the length
-# of the longest ungapped sequence, plus the calculated offset
-max_len = int(max_seq_len*1.35) + max_offset
-# VR_index: To be used in vertical recombination events, the point at which the
-# sequences are broken and conjoined 
-VR_index = random.randint(0, max_seq_len)
-
-# Dictionary with a tuple as a key to hold all organisms                                    
-Population = initial_population(Alignments, pop_size, num_seq, max_offset, max_len)
-
-# Dictionary with an integer as a key to the fitnes score of the coressponding              
-# organism in the population                                                                
-Fitness = initial_fitness(Population, pop_size, subst, gap, max_len)
-
-# Generations
-for gen in range(generations):
-    # Survival of the fitest
-    # Cull the bottom percentage of the population before reproduction events
-    for i in range(num_least_fit):
-        del Population[sorted(Fitness.items(), key=operator.itemgetter(1), reverse = True)[-1][0]]
-        del Fitness[sorted(Fitness.items(), key=operator.itemgetter(1), reverse = True)[-1][0]]
-    # Horizontal & Vertical Recombination
-    # Create the same number of offspring that was just removed from the population
-    # to maintain population size
-    for i in range(num_least_fit):
-    # Select 2 unique parents at random to create an offspring                                     
-        mom = random.choice(Population.keys())
-        dad = random.choice(Population.keys())
-        while mom == dad:
-            dad = random.choice(Population.keys())
-        # Choose a random floating point number between 0 and 1 to determine what type
-        # of reproduction (horizontal recombimation, vertical recombination, or copy)
-        # will occur
-        R_prob = random.random()
-        # Horizontal recombination
-        if R_prob < HR_prob:
-            offspring = horizontal_recombination(Population, mom, dad, num_seq)
-        # Vertical recombination
-        elif R_prob > HR_prob and R_prob < HR_prob+VR_prob:
-            offspring = vertical_recombination(Population, mom, dad, VR_index, num_seq, max_len)
-        # Copy from mom or dad
+import collections
+import json
+import os
+import sys
+import time
+
+# Result of a run: alignment, the trimmed aligned strings of the most fit organism; score,
+# its fitness; stats, one dict per generation with the generation number, best and mean
+# fitness and max_len; stop_reason, why the run ended ('generations', 'plateau', 'target',
+# 'time' or 'diversity'; None for runs without one); pairwise_cache, the stats() of the
+# pairwise cache (hits, misses, hit_rate, ...) for runs with one
+MSAResult = collections.namedtuple('MSAResult', ['alignment', 'score', 'stats', 'stop_reason',
+                                                 'pairwise_cache'], defaults=(None, None))
+
+# Upper bounds on the total mutation and recombination probabilities of adaptive runs
+MAX_MUTATION_PROB = 0.9
+MAX_RECOMBINATION_PROB = 0.95
+
+# Constructor parameters kept in checkpoints (see MSAGeneticAligner.save_checkpoint); the
+# operator probabilities, gap, substitution matrix and selection are kept separately
+CHECKPOINT_PARAMS = ('num_seq', 'pop_size', 'generations', 'culling_percentage', 'legacy_fitness',
+                     'verify_fitness', 'workers', 'pairwise_method', 'band', 'gap_extend', 'seeding',
+                     'patience', 'target_score', 'time_budget', 'min_diversity', 'adaptive',
+                     'adapt_interval', 'adapt_factor', 'fitness_cache', 'checkpoint_interval', 'seed')
+
+class MSAGeneticAligner:
+    """Genetic algorithm aligning several sequences at once.  Every run draws from its own
+    random.Random, so runs with the same seed are reproducible and aligners can run side by side."""
+    def __init__(self, seqs, subst=blosum62, gap=-4, num_seq=None, pop_size=25, generations=500,
+                 culling_percentage=0.4, HR_prob=0.5, VR_prob=0.3, GE_prob=0.05, GA_prob=0.1,
+                 GR_prob=0.05, selection=None, legacy_fitness=False, verify_fitness=False,
+                 workers=1, pairwise_method='auto', band=None, gap_extend=None,
+                 seeding='pairwise', patience=None, target_score=None, time_budget=None,
+                 min_diversity=None, adaptive=False, adapt_interval=10, adapt_factor=1.5,
+                 fitness_cache=128, profiler=None, pairwise_cache=None, checkpoint=None,
+                 checkpoint_interval=50, seed=None):
+        """Set up an aligner; run() does the work.
+        seqs: The sequences to be aligned (strings, FastaRecs or a FASTAFile)
+        subst: The substitution matrix to be used to align
+            For amino acid sequences, can use blosum62, blosum45, or an exact 20x20 matrix
+            For nucleotide sequences, can use an exact 4x4 matrix
+        gap: Gap penalty for inserting any gap in the sequence; with gap_extend, the penalty
+            for opening a run of gaps
+        num_seq: Number of sequences to be aligned (first n of seqs; defaults to all)
+        pop_size: Size of the population
+        generations: Number of generations
+        culling_percentage: Bottom percentage to be removed from the population without
+            reproducing for every generation
+        HR_prob: The probability of a horizontal recombination event occurring
+        VR_prob: The probability of a vertical recombination event occurring
+        GE_prob: The probability of a gap extension mutation occurring
+        GA_prob: The probability of a gap addition mutation occurring
+        GR_prob: The probability of a gap reduction mutation occurring
+        selection: How parents are picked for reproduction; UniformSelection() (the default,
+            every organism equally likely), TruncationSelection(fraction),
+            TournamentSelection(size) or RankSelection(pressure)
+        legacy_fitness: Score gaps as the original calc_fitness did (see HelperFunctions), to
+            reproduce scores of earlier runs exactly
+        verify_fitness: Check every incremental fitness update against a full calc_fitness
+            (slow, for debugging)
+        workers: Number of processes for the initial pairwise alignments
+        pairwise_method: nw() method of the initial pairwise alignments; the default 'auto'
+            aligns optimally and switches to linear memory once sequences get long,
+            'vectorized' reproduces the alignments of earlier runs, and 'banded' is much
+            faster for long, similar sequences
+        band: Initial band width of the 'banded' method (widened automatically as needed)
+        gap_extend: Penalty for each further gap of a run (affine gaps), in both the pairwise
+            alignments and the fitness (with pairwise_method 'vectorized' or 'auto'); None
+            charges every gap the same gap penalty
+        seeding: How the initial population is built; 'pairwise' (randomly offset rows of
+            the pairwise alignments), or 'upgma' or 'nj' (a progressive alignment along a
+            UPGMA or neighbor-joining guide tree, plus copies with a few gaps moved)
+        patience: Stop after this many generations without a better best fitness
+        target_score: Stop once the best fitness reaches this score
+        time_budget: Stop after this many seconds of evolution
+        min_diversity: Stop once the population's diversity (see diversity()) is at or
+            below this value
+        adaptive: Raise the mutation and recombination probabilities while the best
+            fitness stagnates, by adapt_factor every adapt_interval generations without
+            improvement (up to MAX_MUTATION_PROB and MAX_RECOMBINATION_PROB in total), and
+            return to the configured probabilities on improvement
+        fitness_cache: Number of organisms whose scores are memoized by content, so
+            offspring identical to a recently scored organism are not rescored (0 disables
+            the memo; see fitness_model.cache_info())
+        profiler: A GenerationProfiler (see Instrumentation.py) recording per-phase
+            times, operator counts and fitness evaluations of every generation; None for no
+            profiling
+        pairwise_cache: A PairwiseCache, or the path of its sqlite file, keeping pairwise
+            alignments across runs; None aligns every pair anew
+        checkpoint: Path of a checkpoint file written every checkpoint_interval generations
+            and when the run ends; continue an interrupted run with resume(checkpoint)
+        checkpoint_interval: Generations between checkpoints
+        seed: Seed of the random number generator; None seeds from the system
+        """
+        if num_seq is None:
+            num_seq = len(seqs)
+        if num_seq < 2:
+            raise ValueError("At least two sequences are needed, got %d" % num_seq)
+        self.seqs = [seqs[i] for i in range(num_seq)]
+        self.subst = subst
+        self.gap = gap
+        self.gap_extend = gap_extend
+        self.seeding = seeding
+        self.patience = patience
+        self.target_score = target_score
+        self.time_budget = time_budget
+        self.min_diversity = min_diversity
+        self.adaptive = adaptive
+        self.adapt_interval = adapt_interval
+        self.adapt_factor = adapt_factor
+        self.fitness_cache = fitness_cache
+        self.profiler = profiler
+        if isinstance(pairwise_cache, str):
+            pairwise_cache = PairwiseCache(pairwise_cache)
+        self.pairwise_cache = pairwise_cache
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.num_seq = num_seq
+        self.pop_size = pop_size
+        self.generations = generations
+        self.culling_percentage = culling_percentage
+        # num_least_fit: The number of organisms in the population that are removed
+        # without reproducing
+        self.num_least_fit = int(culling_percentage*pop_size)
+        self.HR_prob = HR_prob
+        self.VR_prob = VR_prob
+        self.GE_prob = GE_prob
+        self.GA_prob = GA_prob
+        self.GR_prob = GR_prob
+        if selection is None:
+            selection = UniformSelection()
+        self.selection = selection
+        self.legacy_fitness = legacy_fitness
+        self.verify_fitness = verify_fitness
+        self.workers = workers
+        self.pairwise_method = pairwise_method
+        # Affine pairwise alignments only have the full-matrix engine (see nw())
+        if gap_extend is not None and gap_extend != gap and pairwise_method not in ('vectorized', 'auto'):
+            raise ValueError("pairwise_method %r does not support gap_extend" % pairwise_method)
+        self.band = band
+        self.seed = seed
+        if checkpoint is not None:
+            self._check_checkpointable()
+
+    def initialize(self, Alignments=None):
+        """Create the random number generator and the scored initial population, from
+        Alignments (see initial_pairwise_alignments) if they were already computed."""
+        self.rng = random.Random(self.seed)
+        # Dictionary with tuple as key to hold all possible alignments
+        if Alignments is None:
+            Alignments = initial_pairwise_alignments(self.seqs, self.num_seq, self.subst, self.gap,
+                                                     self.workers, method=self.pairwise_method,
+                                                     band=self.band, gap_extend=self.gap_extend,
+                                                     cache=self.pairwise_cache)
+        # max_seq_len: The length of the longest of the sequences in the initial population
+        max_seq_len = max(len(seq) for seq in self.seqs)
+        # max_offset: The maximum number of gaps to be inserted at the beginning of the
+        # sequence, defined to be 20% of the length of the longest ungapped sequence
+        max_offset = int(0.2*max_seq_len)
+        # max_len: The maximum length of the sequences, defined to be 135% of the length
+        # of the longest ungapped sequence, plus the calculated offset
+        self.max_len = int(max_seq_len*1.35) + max_offset
+        # VR_index: To be used in vertical recombination events, the point at which the
+        # sequences are broken and conjoined
+        self.VR_index = self.rng.randint(0, max_seq_len)
+        if self.seeding == 'pairwise':
+            organisms = initial_population(Alignments, self.pop_size, self.num_seq, max_offset,
+                                           self.max_len, self.rng)
         else:
-            P_prob = random.randint(0, 1)
-            if P_prob == 0:
-                offspring = Population[mom]
+            organisms = guide_tree_population(Alignments, self.seqs, self.pop_size, self.num_seq,
+                                              self.subst, self.gap, self.seeding, rng=self.rng,
+                                              gap_extend=self.gap_extend)
+            # A progressive alignment may be longer than the usual maximum length
+            self.max_len = max(self.max_len, len(organisms[0][0]))
+        # Population: Array-backed store of all organisms, one slot per organism, with the
+        # fitness score of each slot in Population.fitness
+        self.Population = PopulationStore.Population.from_dict(organisms, self.subst, self.max_len)
+        self.fitness_model = self._fitness_model()
+        for i in range(self.pop_size):
+            self.Population.fitness[i] = self.fitness_model.score(i, self.Population[i], self.max_len)
+        self.generation = 0
+        self.stats = []
+        # best_score: The best fitness so far; stagnant: generations since it last improved
+        self.best_score = int(self.Population.fitness[self.Population.alive].max())
+        self.stagnant = 0
+        self.stop_reason = None
+        # elapsed: Seconds of evolution before this process took over the run (resumed runs)
+        self.elapsed = 0.0
+        self.base_probs = (self.HR_prob, self.VR_prob, self.GE_prob, self.GA_prob, self.GR_prob)
+
+    def _fitness_model(self):
+        # fitness_model caches per-column scores of each organism so mutations are rescored
+        # incrementally
+        model = FitnessModel(self.subst, self.gap, self.verify_fitness, self.legacy_fitness,
+                             self.gap_extend, self.fitness_cache)
+        if self.profiler is not None:
+            model = self.profiler.wrap(model)
+        return model
+
+    def cull(self, n=None):
+        """Survival of the fitest: remove the bottom percentage of the population, or the n
+        least fit organisms."""
+        if n is None:
+            n = self.num_least_fit
+        for culled in cull_least_fit(self.Population, n):
+            self.fitness_model.discard(culled)
+
+    def reproduce(self):
+        """Horizontal & vertical recombination: create the same number of offspring that
+        was just removed from the population to maintain population size."""
+        P = self.Population
+        for i in range(self.num_least_fit):
+            # Select 2 unique parents to create an offspring
+            (mom, dad) = choose_parents(P, self.selection, self.rng)
+            # Insert into a free slot of the population
+            key = P.allocate()
+            # Choose a random floating point number between 0 and 1 to determine what type
+            # of reproduction (horizontal recombimation, vertical recombination, or copy)
+            # will occur
+            R_prob = self.rng.random()
+            # Horizontal recombination
+            if R_prob < self.HR_prob:
+                if self.profiler is not None:
+                    self.profiler.count('horizontal_recombination')
+                horizontal_recombination_rows(P, mom, dad, key, self.num_seq, self.rng)
+                P.fitness[key] = self.fitness_model.score(key, P[key], self.max_len)
+            # Vertical recombination
+            elif R_prob > self.HR_prob and R_prob < self.HR_prob+self.VR_prob:
+                if self.profiler is not None:
+                    self.profiler.count('vertical_recombination')
+                vertical_recombination_rows(P, mom, dad, key, self.VR_index, self.num_seq)
+                P.fitness[key] = self.fitness_model.score(key, P[key], self.max_len)
+            # Copy from mom or dad
             else:
-                offspring = Population[dad]
-        # Insert with a unique organism index into the population and calculate fitness
-        key = sorted(Population)[-1] + 1
-        Population[key] = offspring
-        Fitness[key] = calc_fitness(Population[key], subst, gap, max_len)
-
-    # Mutation
-    # Any organism has the same small probability of being mutated
-    for i in range(pop_size):
-        # Select organism to be mutated
-        old_org = random.choice(Population.keys())
-        # Choose a random floating point number between 0 and 1 to determine what type
-        # of mutation may occur (gap extension, gap addition, or gap reduction)
-        M_prob = random.random()
-        # Gap Extension
-        if M_prob < GE_prob:
-            # Extend gap
-            new_org = gap_extension(Population, old_org, num_seq, max_len)
-            # Remove old organism from population
-            del Population[old_org]
-            del Fitness[old_org]
-            # Insert mutated new organism into population and calculate its fitness
-            key = sorted(Population)[-1] + 1
-            Population[key] = new_org
-            Fitness[key] = calc_fitness(Population[key], subst, gap, max_len)
-            # Update maximum length and adjust length of other organisms in the population
-            max_len += 1
-            for k in Population:
-                if k != key:
-                    for j in range(num_seq):
-                        l = list(Population[k][j])
-                        l.append('-')
-                        s = ''.join(l)
-                        Population[k][j] = s
-
-        # Gap Addition
-        elif M_prob > GE_prob and M_prob < GE_prob + GA_prob:
-            # Insert gap
-            new_org = gap_addition(Population, old_org, num_seq, max_len)
-            # Remove old organism from population
-            del Population[old_org]
-            del Fitness[old_org]
-            # Insert mutated new organism into population and calculate its fitness
-            key = sorted(Population)[-1] + 1
-            Population[key] = new_org
-            Fitness[key] = calc_fitness(Population[key], subst, gap, max_len)
-            # Update maximum length and adjest length of other organisms in the population
-            max_len += 1
-            for k in Population:
-                if k != key:
-                    for j in range(num_seq):
-                        l = list(Population[k][j])
-                        l.append('-')
-                        s = ''.join(l)
-                        Population[k][j] = s
-
-        # Gap Reduction
-        elif M_prob > GE_prob + GA_prob and M_prob < GE_prob + GA_prob + GR_prob:
-            # Reduce gap
-            new_org = gap_reduction(Population, old_org, num_seq, max_len)
-            # Remove old organism from population
-            del Population[old_org]
-            del Fitness[old_org]
-            # Insert new mutated organism into population and calculate its fitness
-            key = sorted(Population)[-1] + 1
-            Population[key] = new_org
-            Fitness[key] = calc_fitness(Population[key], subst, gap, max_len)
-    # Report percent of evolution complete
-    if gen % int(0.1 * generations) == 0:
-        print str(100*gen/generations) + "%"
-    
-# Report most fit organism
-most_fit = sorted(Fitness.items(), key=operator.itemgetter(1))[-1][0]
-trimmed_most_fit = trim_gaps(Population, most_fit, num_seq, max_len)
-final_fitness = Fitness[most_fit]
-print 
-print "MULTIPLE SEQUENCE ALIGNMENT"
-for i in range(len(trimmed_most_fit)):
-    print trimmed_most_fit[i]
-print "SCORE"
-print final_fitness
-
-# Cleanup 
-os.system("rm *c")
+                if self.profiler is not None:
+                    self.profiler.count('copy')
+                P_prob = self.rng.randint(0, 1)
+                if P_prob == 0:
+                    parent = mom
+                else:
+                    parent = dad
+                P.copy(parent, key)
+                P.fitness[key] = self.fitness_model.copy(parent, key, P[key], self.max_len)
+
+    def _insert_gap(self, org, pos):
+        P = self.Population
+        gap_insertion_rows(P, org, pos)
+        # Calculate its fitness at the old length, then widen every organism by one
+        # trailing gap column
+        P.fitness[org] = self.fitness_model.insert_gap_column(org, org, P[org], pos, self.max_len)
+        self.max_len += 1
+        P.extend()
+
+    def mutate(self):
+        """Any organism has the same small probability of being mutated; mutated organisms
+        are changed in place."""
+        P = self.Population
+        for i in range(self.pop_size):
+            # Select organism to be mutated
+            org = self.rng.choice(P.keys())
+            # Choose a random floating point number between 0 and 1 to determine what type
+            # of mutation may occur (gap extension, gap addition, or gap reduction)
+            M_prob = self.rng.random()
+            # Gap Extension
+            if M_prob < self.GE_prob:
+                if self.profiler is not None:
+                    self.profiler.count('gap_extension')
+                pos = pick_gap_extension(find_gap_blocks_rows(P, org, self.max_len), self.rng)
+                if pos is not None:
+                    self._insert_gap(org, pos)
+            # Gap Addition
+            elif M_prob > self.GE_prob and M_prob < self.GE_prob + self.GA_prob:
+                if self.profiler is not None:
+                    self.profiler.count('gap_addition')
+                self._insert_gap(org, choose_gap_addition(self.max_len, self.rng))
+            # Gap Reduction
+            elif M_prob > self.GE_prob + self.GA_prob and M_prob < self.GE_prob + self.GA_prob + self.GR_prob:
+                if self.profiler is not None:
+                    self.profiler.count('gap_reduction')
+                pos = pick_gap_reduction(find_gap_blocks_rows(P, org, self.max_len), self.max_len,
+                                         self.rng)
+                if pos is not None:
+                    gap_reduction_rows(P, org, pos)
+                    P.fitness[org] = self.fitness_model.delete_gap_column(org, org, P[org], pos,
+                                                                          self.max_len)
+
+    def adapt(self):
+        """Set the operator probabilities for the current stagnation (adaptive runs)."""
+        (HR_prob, VR_prob, GE_prob, GA_prob, GR_prob) = self.base_probs
+        scale = self.adapt_factor ** (self.stagnant // self.adapt_interval)
+        mutation = min(scale, MAX_MUTATION_PROB / max(GE_prob + GA_prob + GR_prob, 1e-9))
+        recombination = min(scale, MAX_RECOMBINATION_PROB / max(HR_prob + VR_prob, 1e-9))
+        # Never scale down probabilities that already exceed the bounds
+        mutation = max(mutation, 1.0)
+        recombination = max(recombination, 1.0)
+        self.HR_prob = HR_prob * recombination
+        self.VR_prob = VR_prob * recombination
+        self.GE_prob = GE_prob * mutation
+        self.GA_prob = GA_prob * mutation
+        self.GR_prob = GR_prob * mutation
+
+    def diversity(self):
+        """Mean fraction of cells of the living organisms that differ from the most fit
+        one: 0 when every organism is identical."""
+        P = self.Population
+        codes = P.codes[P.alive, :, :self.max_len]
+        return float((codes != P.codes[most_fit(P), :, :self.max_len]).mean())
+
+    def step(self):
+        """Run one generation and record its stats."""
+        profiler = self.profiler
+        if profiler is None:
+            self.cull()
+            self.reproduce()
+            self.mutate()
+        else:
+            profiler.begin(self)
+            profiler.phase('cull', self.cull)
+            profiler.phase('reproduce', self.reproduce)
+            profiler.phase('mutate', self.mutate)
+        fitness = self.Population.fitness[self.Population.alive]
+        best = int(fitness.max())
+        if best > self.best_score:
+            self.best_score = best
+            self.stagnant = 0
+        else:
+            self.stagnant += 1
+        stats = {'generation': self.generation, 'best': best, 'mean': float(fitness.mean()),
+                 'max_len': self.max_len}
+        if self.min_diversity is not None:
+            stats['diversity'] = self.diversity()
+        self.stats.append(stats)
+        if profiler is not None:
+            profiler.end(self, stats)
+        self.generation += 1
+        if self.adaptive:
+            self.adapt()
+
+    def should_stop(self, elapsed):
+        """Why the run should stop after the current generation, given the seconds elapsed
+        since it started, or None to go on."""
+        if self.target_score is not None and self.best_score >= self.target_score:
+            return 'target'
+        if self.patience is not None and self.stagnant >= self.patience:
+            return 'plateau'
+        if self.time_budget is not None and elapsed >= self.time_budget:
+            return 'time'
+        if self.min_diversity is not None and self.stats[-1]['diversity'] <= self.min_diversity:
+            return 'diversity'
+        return None
+
+    def emigrants(self, n):
+        """Copies of the n most fit organisms, fittest first, and the max_len they are
+        scored at."""
+        return self.Population.codes[fittest(self.Population, n)].copy(), self.max_len
+
+    def immigrate(self, organisms, max_len):
+        """Replace the least fit organisms with organisms (as returned by emigrants)."""
+        P = self.Population
+        # Organisms from a longer population widen this one, so no columns are cut off
+        if max_len > self.max_len:
+            P.extend(max_len - self.max_len)
+            self.max_len = max_len
+        P.reserve(organisms.shape[2])
+        self.cull(len(organisms))
+        for organism in organisms:
+            key = P.allocate()
+            P.codes[key, :, :organisms.shape[2]] = organism
+            P.update_gap_columns(key)
+            P.fitness[key] = self.fitness_model.score(key, P[key], self.max_len)
+
+    def best(self):
+        """The most fit organism, trimmed of its outer gap columns, and its fitness."""
+        P = self.Population
+        best = most_fit(P)
+        (start, end) = trimmed_bounds(P.gap_columns[best, :self.max_len])
+        trimmed = [self.subst.decode(P.codes[best, i, start:end]) for i in range(self.num_seq)]
+        return trimmed, int(P.fitness[best])
+
+    def save_checkpoint(self, path):
+        """Write the state of the run (population, fitness, generation, random number
+        generator, parameters and stats) to path, atomically; see resume()."""
+        P = self.Population
+        (rng_version, gauss_next, internal) = rng_state(self.rng)
+        self._check_checkpointable()
+        meta = {'params': {name: getattr(self, name) for name in CHECKPOINT_PARAMS},
+                'gap': self.gap, 'alphabet': self.subst.alphabet,
+                'selection': [type(self.selection).__name__, vars(self.selection)],
+                'seqs': [self.subst.decode(self.subst.encode(seq)) for seq in self.seqs],
+                'generation': self.generation, 'max_len': self.max_len,
+                'VR_index': self.VR_index, 'best_score': self.best_score,
+                'stagnant': self.stagnant, 'stop_reason': self.stop_reason,
+                'elapsed': self.elapsed, 'base_probs': self.base_probs,
+                'probs': (self.HR_prob, self.VR_prob, self.GE_prob, self.GA_prob, self.GR_prob),
+                'rng_version': rng_version, 'gauss_next': gauss_next, 'stats': self.stats}
+        arrays = P.state()
+        arrays['scores'] = self.subst.table[1:, 1:]
+        arrays['rng_state'] = internal
+        write_checkpoint(path, meta, arrays)
+
+    def _check_checkpointable(self):
+        # Selection strategies are rebuilt by class name and attributes, and parameters are
+        # stored as JSON, so find out before the run rather than at its first checkpoint
+        if globals().get(type(self.selection).__name__) is not type(self.selection):
+            raise ValueError("Cannot checkpoint selection %r" % self.selection)
+        try:
+            json.dumps([{name: getattr(self, name) for name in CHECKPOINT_PARAMS},
+                        vars(self.selection)])
+        except TypeError as e:
+            raise ValueError("Cannot checkpoint parameters: %s" % e)
+
+    def restore(self, meta, arrays):
+        """Continue from a checkpoint read by read_checkpoint, in place of initialize(); the
+        aligner must have been created with the checkpoint's sequences and parameters."""
+        self.rng = random.Random()
+        set_rng_state(self.rng, meta['rng_version'], meta['gauss_next'], arrays['rng_state'])
+        self.max_len = meta['max_len']
+        self.VR_index = meta['VR_index']
+        self.Population = PopulationStore.Population.from_state(arrays, self.max_len)
+        self.fitness_model = self._fitness_model()
+        P = self.Population
+        for key in P.keys():
+            if self.fitness_model.score(key, P[key], self.max_len) != P.fitness[key]:
+                raise ValueError("Fitness of organism %d does not match the checkpoint; was it "
+                                 "written with another substitution matrix or gap penalty?" % key)
+        self.generation = meta['generation']
+        self.stats = meta['stats']
+        self.best_score = meta['best_score']
+        self.stagnant = meta['stagnant']
+        self.stop_reason = meta['stop_reason']
+        self.elapsed = meta['elapsed']
+        self.base_probs = tuple(meta['base_probs'])
+        (self.HR_prob, self.VR_prob, self.GE_prob, self.GA_prob, self.GR_prob) = meta['probs']
+
+    @classmethod
+    def resume(cls, path, **params):
+        """Create an aligner continuing the run checkpointed at path; evolve() then carries
+        on exactly as the checkpointed run would have.  Keyword parameters override those of
+        the checkpoint (generations, to run longer; profiler; ...), and checkpoints go on
+        being written to path unless checkpoint is given."""
+        (meta, arrays) = read_checkpoint(path)
+        kwargs = dict(meta['params'])
+        kwargs.update(zip(('HR_prob', 'VR_prob', 'GE_prob', 'GA_prob', 'GR_prob'),
+                          meta['base_probs']))
+        (name, selection) = meta['selection']
+        kwargs['selection'] = globals()[name](**selection)
+        kwargs['checkpoint'] = path
+        kwargs.update(params)
+        subst = kwargs.pop('subst', None)
+        if subst is None:
+            subst = SubstitutionMatrix(meta['alphabet'], arrays['scores'].tolist())
+        aligner = cls(meta['seqs'], subst, kwargs.pop('gap', meta['gap']), **kwargs)
+        aligner.restore(meta, arrays)
+        return aligner
+
+    def evolve(self, progress=None):
+        """Evolve an initialized (or restored) population until the configured number of
+        generations, or until a stopping criterion is met, writing checkpoints if
+        configured.  progress, if given, is called with the percentage complete every tenth
+        of the run."""
+        start = time.time() - self.elapsed
+        self.stop_reason = 'generations'
+        reason = None
+        # A restored run may have stopped for another reason than its generations
+        if self.stats:
+            reason = self.should_stop(self.elapsed)
+        while reason is None and self.generation < self.generations:
+            gen = self.generation
+            self.step()
+            # Report percent of evolution complete
+            if progress is not None and gen % max(1, int(0.1 * self.generations)) == 0:
+                progress(100*gen//self.generations)
+            self.elapsed = time.time() - start
+            reason = self.should_stop(self.elapsed)
+            if (self.checkpoint is not None and reason is None
+                    and self.generation % self.checkpoint_interval == 0):
+                self.save_checkpoint(self.checkpoint)
+        if reason is not None:
+            self.stop_reason = reason
+        if self.checkpoint is not None:
+            self.save_checkpoint(self.checkpoint)
+        alignment, score = self.best()
+        cache_stats = None
+        if self.pairwise_cache is not None:
+            cache_stats = self.pairwise_cache.stats()
+        return MSAResult(alignment, score, self.stats, self.stop_reason, cache_stats)
+
+    def run(self, progress=None):
+        """Evolve the population for the configured number of generations, or until a stopping
+        criterion is met.  progress, if given, is called with the percentage complete every
+        tenth of the run."""
+        self.initialize()
+        return self.evolve(progress)
+
+# Align sequences with the genetic algorithm
+# Input: seqs, the sequences; subst, the substitution matrix; gap, the gap penalty; any
+# other MSAGeneticAligner parameter by keyword
+# Output: MSAResult with the best alignment, its score and per-generation stats
+def run_msa(seqs, subst=blosum62, gap=-4, **params):
+    return MSAGeneticAligner(seqs, subst, gap, **params).run()
+
+# Usage: python MSA_GA.py [FASTA file] [number of sequences] [checkpoint file] [pairwise cache file]
+# Aligns the first sequences (three by default) of globin_fragments.fasta by default.  With a
+# checkpoint file, the run is checkpointed to it, and resumed from it if it exists ('-' for no
+# checkpoint).  With a pairwise cache file, pairwise alignments are looked up in and stored to
+# it, and its hit rate is printed.
+if __name__ == '__main__':
+    fasta = 'globin_fragments.fasta'
+    num_seq = 3
+    checkpoint = None
+    pairwise_cache = None
+    if len(sys.argv) > 1:
+        fasta = sys.argv[1]
+    if len(sys.argv) > 2:
+        num_seq = int(sys.argv[2])
+    if len(sys.argv) > 3 and sys.argv[3] != '-':
+        checkpoint = sys.argv[3]
+    if len(sys.argv) > 4:
+        pairwise_cache = sys.argv[4]
+    if checkpoint is not None and os.path.exists(checkpoint):
+        aligner = MSAGeneticAligner.resume(checkpoint)
+        print("Resuming at generation " + str(aligner.generation))
+        result = aligner.evolve(lambda percent: print(str(percent) + "%"))
+    else:
+        aligner = MSAGeneticAligner(FASTAFile(fasta), num_seq=num_seq, checkpoint=checkpoint,
+                                    pairwise_cache=pairwise_cache)
+        result = aligner.run(lambda percent: print(str(percent) + "%"))
+    print()
+    print("MULTIPLE SEQUENCE ALIGNMENT")
+    for row in result.alignment:
+        print(row)
+    print("SCORE")
+    print(result.score)
+    if result.pairwise_cache is not None:
+        print("PAIRWISE CACHE")
+        print("%d hits, %d misses (%.0f%% hit rate), %d entries, %d bytes"
+              % (result.pairwise_cache['hits'], result.pairwise_cache['misses'],
+                 100 * result.pairwise_cache['hit_rate'], result.pairwise_cache['entries'],
+                 result.pairwise_cache['bytes']))
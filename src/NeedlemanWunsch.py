@@ -98,11 +98,396 @@ def backtrace (M, a, b):
     # Return alignment strings                                                                         
     return str_1, str_2
 
+# Backpointer codes used by the vectorized engine, stored in a uint8 matrix
+PTR_NONE = 0
+PTR_DIAG = 1
+PTR_VERT = 2
+PTR_HORIZ = 3
+
+# Alignments with more cells than this are computed in linear memory by nw(method='auto')
+HIRSCHBERG_THRESHOLD = 25000000
+# Sub-problems at or below this many cells are solved with a full matrix inside hirschberg()
+HIRSCHBERG_LEAF_CELLS = 65536
+# Initial band width of banded alignments, in diagonals on each side of the main ones
+DEFAULT_BAND = 16
+# Score of cells outside the band; low enough to never win, high enough not to overflow
+BAND_NEG = -(2**30)
+
+# Function to compute one row of the scoring matrix from the row above it
+# Input: prev, the previous score row; first, the score of the new row's first column; ai, the
+# code of the residue for this row; b, integer-encoded sequence; table, the dense substitution
+# table; gap, the gap penalty; steps, the gap ramp 0, gap, 2*gap, ...
+# Output: (row, pointers), the int32 score row and uint8 backpointers for columns 1..n
+def fill_row(prev, first, ai, b, table, gap, steps):
+    # Diagonal and vertical moves only depend on the previous row
+    diagonal_score = prev[:-1] + table[ai, b]
+    vertical_score = prev[1:] + gap
+    take_diagonal = diagonal_score >= vertical_score
+    best = numpy.where(take_diagonal, diagonal_score, vertical_score)
+    # Horizontal moves chain along the row: S[i][j] = max over k <= j of
+    # best[k] + (j-k)*gap, which is a running maximum once the gap ramp is removed
+    row = numpy.empty(len(prev), dtype=numpy.int32)
+    row[0] = first
+    row[1:] = best
+    row = numpy.maximum.accumulate(row - steps) + steps
+    # Prefer diagonal, then vertical, then horizontal on ties
+    pointers = numpy.where(row[1:] > best, PTR_HORIZ,
+                           numpy.where(take_diagonal, PTR_DIAG, PTR_VERT))
+    return row, pointers
+
+# Function to create scoring and backpointer matrices with vectorized row updates
+# Input: a and b, integer-encoded sequences; table, the dense substitution table; gap, the
+# gap penalty to be used
+# Output: (S, P), an int32 score matrix and a uint8 backpointer matrix, both m+1 by n+1
+def score_matrix(a, b, table, gap):
+    m = len(a)
+    n = len(b)
+    S = numpy.empty([m+1, n+1], dtype=numpy.int32)
+    P = numpy.empty([m+1, n+1], dtype=numpy.uint8)
+    # First row and column are built from gap penalties only
+    steps = numpy.arange(n+1, dtype=numpy.int32) * gap
+    S[0, :] = steps
+    S[:, 0] = numpy.arange(m+1, dtype=numpy.int32) * gap
+    P[0, :] = PTR_HORIZ
+    P[:, 0] = PTR_VERT
+    P[0, 0] = PTR_NONE
+    for i in range(1, m+1):
+        S[i], P[i, 1:] = fill_row(S[i-1], S[i, 0], a[i-1], b, table, gap, steps)
+    return S, P
+
+# Function to compute only the last row of the scoring matrix, keeping two rows in memory
+# Input: a and b, integer-encoded sequences; table, the dense substitution table; gap, the gap penalty
+# Output: int32 array of the n+1 scores in row m
+def last_row(a, b, table, gap):
+    steps = numpy.arange(len(b)+1, dtype=numpy.int32) * gap
+    row = steps
+    for i in range(1, len(a)+1):
+        row = fill_row(row, i*gap, a[i-1], b, table, gap, steps)[0]
+    return row
+
+# Function to list the moves of the optimal path through a backpointer matrix, from the
+# bottom right corner back to the origin
+# Input: P, backpointer matrix
+# Output: list of PTR_DIAG, PTR_VERT and PTR_HORIZ moves from the origin to the corner
+def path_moves(P):
+    moves = []
+    i = P.shape[0]-1
+    j = P.shape[1]-1
+    while i > 0 or j > 0:
+        pointer = P.item(i, j)
+        moves.append(pointer)
+        if pointer != PTR_HORIZ:
+            i -= 1
+        if pointer != PTR_VERT:
+            j -= 1
+    moves.reverse()
+    return moves
+
+# Hirschberg divide-and-conquer alignment in O(m+n) memory
+# Input: a and b, integer-encoded sequences; table, the dense substitution table; gap, the gap penalty
+# Output: list of PTR_DIAG, PTR_VERT and PTR_HORIZ moves of an optimal global alignment
+def hirschberg(a, b, table, gap):
+    m = len(a)
+    n = len(b)
+    if m == 0:
+        return [PTR_HORIZ] * n
+    if n == 0:
+        return [PTR_VERT] * m
+    if m == 1 or (m+1)*(n+1) <= HIRSCHBERG_LEAF_CELLS:
+        return path_moves(score_matrix(a, b, table, gap)[1])
+    # Split a in half and find where the optimal path crosses the middle row, using the
+    # forward scores of the top half and the backward scores of the bottom half
+    mid = m // 2
+    forward = last_row(a[:mid], b, table, gap)
+    backward = last_row(a[mid:][::-1], b[::-1], table, gap)[::-1]
+    split = int(numpy.argmax(forward + backward))
+    return (hirschberg(a[:mid], b[:split], table, gap) +
+            hirschberg(a[mid:], b[split:], table, gap))
+
+# Function to create the backpointers of a banded scoring matrix, keeping only the diagonals
+# j-i in [lo, hi]; band column c of row i is matrix column j = i+lo+c
+# Input: a and b, integer-encoded sequences; table, the dense substitution table; gap, the gap
+# penalty; lo and hi, the lowest and highest diagonal kept (lo <= min(0, n-m), hi >= max(0, n-m))
+# Output: (score, P), the optimal score within the band at (m, n) and the m+1 by hi-lo+1 uint8
+# band of backpointers
+def banded_matrix(a, b, table, gap, lo, hi):
+    m = len(a)
+    n = len(b)
+    w = hi - lo + 1
+    P = numpy.full([m+1, w], PTR_NONE, dtype=numpy.uint8)
+    steps = numpy.arange(w, dtype=numpy.int32) * gap
+    # j[i, c], the matrix column of every band cell; cells off the matrix stay at BAND_NEG
+    j = numpy.arange(m+1)[:, None] + (numpy.arange(w) + lo)
+    valid = (j >= 0) & (j <= n)
+    # Substitution scores of the diagonal move into every cell, in one gather; cells without a
+    # diagonal predecessor (column 0 or off the matrix) get BAND_NEG, so column 0 is reached
+    # by vertical moves without special cases
+    b_padded = numpy.concatenate(([0], b, [0]))
+    sub = table[numpy.concatenate(([0], a))[:, None], b_padded[numpy.clip(j, 0, n+1)]]
+    sub = numpy.where(valid & (j >= 1), sub, BAND_NEG // 2).astype(numpy.int32)
+    # Only rows reaching past either end of b need masking after the horizontal pass
+    edge = (numpy.arange(m+1) + lo < 0) | (numpy.arange(m+1) + hi > n)
+    # Row 0 is reached by horizontal moves only
+    prev = numpy.where(valid[0], j[0] * gap, BAND_NEG).astype(numpy.int32)
+    P[0, valid[0] & (j[0] > 0)] = PTR_HORIZ
+    vertical_score = numpy.empty(w, dtype=numpy.int32)
+    vertical_score[-1] = BAND_NEG
+    for i in range(1, m+1):
+        # Diagonal predecessor (i-1, j-1) sits in the same band column, vertical (i-1, j) in the next
+        diagonal_score = prev + sub[i]
+        vertical_score[:-1] = prev[1:]
+        vertical_score[:-1] += gap
+        take_diagonal = diagonal_score >= vertical_score
+        best = numpy.maximum(diagonal_score, vertical_score)
+        row = numpy.maximum.accumulate(best - steps) + steps
+        if edge[i]:
+            row[~valid[i]] = BAND_NEG
+        pointers = PTR_VERT - take_diagonal.view(numpy.uint8)
+        pointers[row > best] = PTR_HORIZ
+        P[i] = pointers
+        prev = row
+    return int(prev[n - m - lo]), P
+
+# Function to list the moves of the optimal path through a band of backpointers
+# Input: P, band of backpointers from banded_matrix; m and n, sequence lengths; lo, lowest diagonal
+# Output: list of PTR_DIAG, PTR_VERT and PTR_HORIZ moves from the origin to (m, n)
+def band_path_moves(P, m, n, lo):
+    moves = []
+    i = m
+    c = n - m - lo
+    while i > 0 or i + lo + c > 0:
+        pointer = P.item(i, c)
+        moves.append(pointer)
+        if pointer == PTR_DIAG:
+            i -= 1
+        elif pointer == PTR_VERT:
+            i -= 1
+            c += 1
+        else:
+            c -= 1
+    moves.reverse()
+    return moves
+
+# Banded Needleman-Wunsch: fill only the diagonals within band of the main ones, widening the
+# band until its best score provably beats every path that leaves it
+# Input: a and b, integer-encoded sequences; table, the dense substitution table; gap, the gap
+# penalty; band, initial band width (defaults to DEFAULT_BAND)
+# Output: list of PTR_DIAG, PTR_VERT and PTR_HORIZ moves of an optimal global alignment
+def banded(a, b, table, gap, band=None):
+    if band is None:
+        band = DEFAULT_BAND
+    m = len(a)
+    n = len(b)
+    # An aligned pair (x, y) scores at most (best[x] + best[y]) / 2, with best[x] the best score
+    # of residue x against any residue, so a path gapping the residues in set R scores at most
+    # (sum(best) - sum(best[R])) / 2 + gap * |R|; the bound is largest for the lowest best[R]
+    best = table.max(axis=1).astype(numpy.int64)
+    residues = numpy.concatenate((best[a], best[b]))
+    upper = int(residues.sum())
+    lowest = numpy.concatenate(([0], numpy.cumsum(numpy.sort(residues))))
+    while True:
+        lo = min(0, n-m) - band
+        hi = max(0, n-m) + band
+        score, P = banded_matrix(a, b, table, gap, lo, hi)
+        if lo <= -m and hi >= n:
+            break
+        # A path leaving the band reaches diagonal hi+1 or lo-1 and comes back to n-m, so it
+        # gaps at least min_gaps residues
+        min_gaps = min(2*(hi+1) - (n-m), (n-m) - 2*(lo-1))
+        if min_gaps > m+n:
+            break
+        # (Only a bound while gapping a residue always costs more than aligning it)
+        if 2*gap < residues.min() and 2*score >= upper - int(lowest[min_gaps]) + 2*gap*min_gaps:
+            break
+        band = max(2*band, 1)
+    return band_path_moves(P, m, n, lo)
+
+# Affine gaps (Gotoh): a run of L gaps scores gap_open + (L-1)*gap_extend, with
+# gap_open <= gap_extend <= 0.  Three scores are kept per cell, one per move ending the path
+# there (PTR_DIAG, PTR_VERT, PTR_HORIZ); each backpointer byte packs the best of the three
+# (bits 0-1) and the state the vertical (bits 2-3) and horizontal (bits 4-5) scores came from.
+AFFINE_BEST_SHIFT = 0
+AFFINE_VERT_SHIFT = 2
+AFFINE_HORIZ_SHIFT = 4
+
+# Best of two or three scores as a state, preferring the earlier argument on ties
+def _state2(s1, state1, s2, state2):
+    return numpy.where(s1 >= s2, state1, state2).astype(numpy.uint8)
+
+def _state3(diagonal, vertical, horizontal):
+    return numpy.where((diagonal >= vertical) & (diagonal >= horizontal), PTR_DIAG,
+                       _state2(vertical, PTR_VERT, horizontal, PTR_HORIZ)).astype(numpy.uint8)
+
+# Function to create the packed backpointers of an affine-gap scoring matrix, a row at a time
+# Input: a and b, integer-encoded sequences; table, the dense substitution table; gap_open and
+# gap_extend, the affine gap penalties
+# Output: (score, P), the optimal score at (m, n) and the m+1 by n+1 uint8 packed backpointers
+def gotoh_matrix(a, b, table, gap_open, gap_extend):
+    m = len(a)
+    n = len(b)
+    P = numpy.zeros([m+1, n+1], dtype=numpy.uint8)
+    columns = numpy.arange(n+1)
+    ramp = (columns * gap_extend).astype(numpy.int32)
+    # Row 0: a horizontal run from the origin
+    diagonal = numpy.full(n+1, BAND_NEG, dtype=numpy.int32)
+    diagonal[0] = 0
+    vertical = numpy.full(n+1, BAND_NEG, dtype=numpy.int32)
+    horizontal = numpy.full(n+1, BAND_NEG, dtype=numpy.int32)
+    horizontal[1:] = gap_open + ramp[:-1]
+    P[0, 0] = PTR_DIAG
+    P[0, 1:] = PTR_HORIZ | (PTR_HORIZ << AFFINE_HORIZ_SHIFT)
+    if n > 0:
+        P[0, 1] = PTR_HORIZ | (PTR_DIAG << AFFINE_HORIZ_SHIFT)
+    for i in range(1, m+1):
+        best = numpy.maximum(numpy.maximum(diagonal, vertical), horizontal)
+        # Vertical: open from a diagonal or horizontal end above, or extend a vertical run
+        vertical_open = numpy.maximum(diagonal, horizontal) + gap_open
+        vertical_extend = vertical + gap_extend
+        vertical_from = numpy.where(vertical_extend > vertical_open, PTR_VERT,
+                                    _state2(diagonal, PTR_DIAG, horizontal, PTR_HORIZ))
+        vertical = numpy.maximum(vertical_open, vertical_extend)
+        # Diagonal: any end at (i-1, j-1) plus the residue pair
+        diagonal = numpy.empty(n+1, dtype=numpy.int32)
+        diagonal[0] = BAND_NEG
+        diagonal[1:] = best[:-1] + table[a[i-1], b]
+        # Horizontal: the best diagonal or vertical end at any k < j, opened there and
+        # extended to j, found with a running max
+        opened = numpy.maximum(diagonal, vertical)
+        horizontal = numpy.empty(n+1, dtype=numpy.int32)
+        horizontal[0] = BAND_NEG
+        horizontal[1:] = numpy.maximum.accumulate(opened[:-1] - ramp[:-1]) + ramp[:-1] + gap_open
+        horizontal_from = numpy.full(n+1, PTR_HORIZ, dtype=numpy.uint8)
+        horizontal_from[1:] = numpy.where(opened[:-1] + gap_open >= horizontal[:-1] + gap_extend,
+                                          _state2(diagonal[:-1], PTR_DIAG, vertical[:-1], PTR_VERT),
+                                          PTR_HORIZ)
+        P[i] = (_state3(diagonal, vertical, horizontal) << AFFINE_BEST_SHIFT
+                | vertical_from << AFFINE_VERT_SHIFT | horizontal_from << AFFINE_HORIZ_SHIFT)
+    return int(max(diagonal[n], vertical[n], horizontal[n])), P
+
+# Function to list the moves of the optimal path through packed affine backpointers
+# Input: P, packed backpointers from gotoh_matrix
+# Output: list of PTR_DIAG, PTR_VERT and PTR_HORIZ moves from the origin to (m, n)
+def gotoh_path_moves(P):
+    moves = []
+    i = P.shape[0]-1
+    j = P.shape[1]-1
+    state = (P.item(i, j) >> AFFINE_BEST_SHIFT) & 3
+    while i > 0 or j > 0:
+        moves.append(state)
+        if state == PTR_DIAG:
+            i -= 1
+            j -= 1
+            state = (P.item(i, j) >> AFFINE_BEST_SHIFT) & 3
+        elif state == PTR_VERT:
+            state = (P.item(i, j) >> AFFINE_VERT_SHIFT) & 3
+            i -= 1
+        else:
+            state = (P.item(i, j) >> AFFINE_HORIZ_SHIFT) & 3
+            j -= 1
+    moves.reverse()
+    return moves
+
+# Function to turn a list of alignment moves into alignment strings
+# Input: moves, list of PTR_DIAG, PTR_VERT and PTR_HORIZ; a and b, sequences
+# Output: aligned sequence strings
+def apply_moves(moves, a, b):
+    seq_1 = []
+    seq_2 = []
+    i = 0
+    j = 0
+    for move in moves:
+        if move == PTR_HORIZ:
+            seq_1.append('-')
+        else:
+            seq_1.append(a[i])
+            i += 1
+        if move == PTR_VERT:
+            seq_2.append('-')
+        else:
+            seq_2.append(b[j])
+            j += 1
+    return ''.join(seq_1), ''.join(seq_2)
+
+# Function to backtrace through a backpointer matrix from score_matrix
+# Input: P, backpointer matrix; a and b, sequences
+# Output: Best alignment strings, walked exactly as backtrace() walks an Entry matrix
+def backtrace_pointers(P, a, b):
+    seq_1 = []
+    seq_2 = []
+    i = len(a)-1
+    j = len(b)-1
+    pointer = P.item(i, j)
+    while pointer != PTR_NONE:
+        if pointer == PTR_DIAG:
+            seq_1.append(a[i])
+            seq_2.append(b[j])
+            i -= 1
+            j -= 1
+        elif pointer == PTR_VERT:
+            seq_1.append(a[i])
+            seq_2.append('-')
+            i -= 1
+        else:
+            seq_1.append('-')
+            seq_2.append(b[j])
+            j -= 1
+        pointer = P.item(i, j)
+    seq_1.append(a[i])
+    seq_2.append(b[j])
+    seq_1.reverse()
+    seq_2.reverse()
+    return ''.join(seq_1), ''.join(seq_2)
+
 # Needleman-Wunsch Global Alignment                                                                    
-# Input: a and b, string sequences; subst, a substitution matrix; gap, negative gap penalty            
+# Input: a and b, string sequences; subst, a substitution matrix; gap, negative gap penalty;
+# method, 'vectorized' for the NumPy engine, 'hirschberg' for the linear-memory engine,
+# 'banded' for the banded engine, 'auto' for an optimal full matrix up to max_cells cells and
+# 'hirschberg' above, or 'legacy' for the Entry matrix; max_cells, the matrix size above
+# which 'auto' switches to 'hirschberg', and above which affine alignments are refused
+# (defaults to HIRSCHBERG_THRESHOLD); band, the initial band width of 'banded' (defaults to
+# DEFAULT_BAND); gap_extend, if given and different from gap, scores a run of L gaps as
+# gap + (L-1)*gap_extend (affine gaps, aligned optimally with the full Gotoh matrices by
+# 'vectorized' and 'auto'; the other methods raise ValueError)
 # Output: globally aligned sequence strings                                                            
-def nw(a, b, subst, gap):
-    # Generate scoring matrix                                                                          
-    M = matrix(a, b, subst, gap)
-    # Returned alignment strings                                                                       
-    return backtrace(M, a, b)
+# Note: 'vectorized' and 'legacy' backtrace from cell (m-1, n-1) and always pair the first
+# residues, as this module always has, whatever the input size; 'auto', 'hirschberg' and
+# 'banded' return an alignment scoring the full matrix optimum at (m, n)
+def nw(a, b, subst, gap, method='vectorized', max_cells=None, band=None, gap_extend=None):
+    if gap_extend is not None and gap_extend != gap:
+        if gap_extend < gap:
+            raise ValueError("Gap extension penalty %s is larger than gap opening penalty %s"
+                             % (-gap_extend, -gap))
+        if method not in ('vectorized', 'auto'):
+            raise ValueError("The %s method only supports linear gaps" % method)
+        if max_cells is None:
+            max_cells = HIRSCHBERG_THRESHOLD
+        # There is no linear-memory affine engine; don't silently allocate a huge matrix
+        if (len(a)+1)*(len(b)+1) > max_cells:
+            raise ValueError("Affine alignment of %d x %d residues needs more than max_cells=%d "
+                             "backpointer cells" % (len(a), len(b), max_cells))
+        score, P = gotoh_matrix(subst.encode(a), subst.encode(b), subst.table, gap, gap_extend)
+        return apply_moves(gotoh_path_moves(P), a, b)
+    if method == 'auto':
+        if max_cells is None:
+            max_cells = HIRSCHBERG_THRESHOLD
+        if (len(a)+1)*(len(b)+1) > max_cells:
+            method = 'hirschberg'
+        else:
+            S, P = score_matrix(subst.encode(a), subst.encode(b), subst.table, gap)
+            return apply_moves(path_moves(P), a, b)
+    if method == 'legacy':
+        # Generate scoring matrix                                                                      
+        M = matrix(a, b, subst, gap)
+        # Returned alignment strings                                                                   
+        return backtrace(M, a, b)
+    elif method == 'vectorized':
+        S, P = score_matrix(subst.encode(a), subst.encode(b), subst.table, gap)
+        return backtrace_pointers(P, a, b)
+    elif method == 'hirschberg':
+        moves = hirschberg(subst.encode(a), subst.encode(b), subst.table, gap)
+        return apply_moves(moves, a, b)
+    elif method == 'banded':
+        moves = banded(subst.encode(a), subst.encode(b), subst.table, gap, band)
+        return apply_moves(moves, a, b)
+    else:
+        raise ValueError("Unknown alignment method: %s" % method)
@@ -0,0 +1,206 @@
+# Persistent cache of pairwise alignments, shared by runs and processes through one sqlite file
+
+# Import
+import hashlib
+import os
+import sqlite3
+import time
+import zlib
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS alignments (
+    key BLOB PRIMARY KEY,
+    aligned BLOB NOT NULL,
+    score INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS alignments_last_used ON alignments (last_used);
+CREATE TABLE IF NOT EXISTS meta (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (id, total)
+    SELECT 0, COALESCE(SUM(size), 0) FROM alignments WHERE NOT EXISTS (SELECT 1 FROM meta);
+'''
+
+# sqlite limits the number of parameters of one statement
+BATCH = 500
+
+def _raw(seq):
+    if isinstance(seq, str):
+        return seq.encode('ascii')
+    if isinstance(seq, (bytes, bytearray, memoryview)) or hasattr(seq, '__bytes__'):
+        return bytes(seq)
+    return ''.join(seq).encode('ascii')
+
+class PairwiseCache:
+    """Aligned pairs and their scores keyed by a SHA-256 of both sequences, the substitution
+    matrix (alphabet and scores), the gap penalties and the alignment method.  Entries are
+    evicted least recently used first once they take more than max_bytes; the total size is
+    kept in the meta table by every write, so puts never scan the cache.  Every process
+    opens its own connection; sqlite's write-ahead log and busy timeout let several processes
+    read and write the file at once.  hits and misses count the lookups of this instance."""
+    def __init__(self, path, max_bytes=256 * 2**20, timeout=30.0):
+        """Open (creating if needed) the cache file at path."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = None
+        self._matrices = {}
+
+    def __getstate__(self):
+        # Connections cannot cross processes; the copy opens its own
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_pid'] = None
+        return state
+
+    def connection(self):
+        """The sqlite connection of this process."""
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                               isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def _matrix_digest(self, subst):
+        if id(subst) not in self._matrices:
+            digest = hashlib.sha256(subst.alphabet.encode('ascii'))
+            digest.update(subst.table.tobytes())
+            self._matrices[id(subst)] = (subst, digest.digest())
+        return self._matrices[id(subst)][1]
+
+    def key(self, a, b, subst, gap, gap_extend=None, method='vectorized', band=None):
+        """Cache key of the nw() alignment of a and b with these parameters."""
+        digest = hashlib.sha256(self._matrix_digest(subst))
+        digest.update(repr((gap, gap_extend, method, band)).encode('ascii'))
+        a = _raw(a)
+        b = _raw(b)
+        # Lengths first, so the boundary between the sequences is unambiguous
+        digest.update(repr((len(a), len(b))).encode('ascii'))
+        digest.update(a)
+        digest.update(b)
+        return digest.digest()
+
+    def get_many(self, keys):
+        """Look up several keys.  Returns a dict from each key found to its (aligned1,
+        aligned2, score), and marks those entries as recently used."""
+        found = {}
+        connection = self.connection()
+        unique = list(set(keys))
+        for start in range(0, len(unique), BATCH):
+            batch = unique[start:start + BATCH]
+            rows = connection.execute(
+                'SELECT key, aligned, score FROM alignments WHERE key IN (%s)'
+                % ','.join('?' * len(batch)), batch).fetchall()
+            for (key, aligned, score) in rows:
+                (aligned1, aligned2) = zlib.decompress(aligned).decode('ascii').split('\n')
+                found[bytes(key)] = (aligned1, aligned2, score)
+        if found:
+            now = time.time()
+            hit = list(found)
+            for start in range(0, len(hit), BATCH):
+                batch = hit[start:start + BATCH]
+                connection.execute('UPDATE alignments SET last_used = ? WHERE key IN (%s)'
+                                   % ','.join('?' * len(batch)), [now] + batch)
+        hits = sum(1 for key in keys if key in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def get(self, key):
+        """(aligned1, aligned2, score) stored under key, or None."""
+        return self.get_many([key]).get(key)
+
+    def put_many(self, entries):
+        """Store several (key, aligned1, aligned2, score) entries, then evict the least
+        recently used entries if the cache is over max_bytes, in one transaction."""
+        now = time.time()
+        rows = {}
+        for (key, aligned1, aligned2, score) in entries:
+            aligned = zlib.compress((aligned1 + '\n' + aligned2).encode('ascii'))
+            rows[key] = (key, aligned, int(score), len(aligned) + len(key), now)
+        rows = list(rows.values())
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # Entries replaced by the insert no longer count towards the total
+            replaced = 0
+            for start in range(0, len(rows), BATCH):
+                batch = [row[0] for row in rows[start:start + BATCH]]
+                replaced += connection.execute(
+                    'SELECT COALESCE(SUM(size), 0) FROM alignments WHERE key IN (%s)'
+                    % ','.join('?' * len(batch)), batch).fetchone()[0]
+            connection.executemany('INSERT OR REPLACE INTO alignments VALUES (?, ?, ?, ?, ?)', rows)
+            total = self._add_total(connection, sum(row[3] for row in rows) - replaced)
+            if total > self.max_bytes:
+                self._evict(connection, total, self.max_bytes)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def put(self, key, aligned1, aligned2, score):
+        self.put_many([(key, aligned1, aligned2, score)])
+
+    def _add_total(self, connection, change):
+        connection.execute('UPDATE meta SET total = total + ? WHERE id = 0', (change,))
+        return connection.execute('SELECT total FROM meta WHERE id = 0').fetchone()[0]
+
+    def evict(self, max_bytes=None):
+        """Delete least recently used entries until at most 90% of max_bytes is used, if more
+        than max_bytes is.  Returns the number of entries deleted."""
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            total = self._add_total(connection, 0)
+            deleted = self._evict(connection, total, max_bytes) if total > max_bytes else 0
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return deleted
+
+    def _evict(self, connection, total, max_bytes):
+        # Called inside a write transaction, with total the size of all entries
+        excess = total - int(0.9 * max_bytes)
+        # Oldest entries until enough bytes are freed; a batch shares one last_used, so
+        # entries are picked by key rather than by a timestamp cutoff
+        keys = []
+        freed = 0
+        cursor = connection.execute('SELECT key, size FROM alignments ORDER BY last_used, key')
+        for (key, size) in cursor:
+            keys.append(key)
+            freed += size
+            if freed >= excess:
+                break
+        cursor.close()
+        deleted = 0
+        for start in range(0, len(keys), BATCH):
+            batch = keys[start:start + BATCH]
+            deleted += connection.execute('DELETE FROM alignments WHERE key IN (%s)'
+                                          % ','.join('?' * len(batch)), batch).rowcount
+        self._add_total(connection, -freed)
+        return deleted
+
+    def stats(self):
+        """Lookups of this instance and the size of the cache file's contents."""
+        (entries, size) = self.connection().execute(
+            'SELECT (SELECT COUNT(*) FROM alignments), total FROM meta WHERE id = 0').fetchone()
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / float(lookups) if lookups else 0.0,
+                'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes}
@@ -0,0 +1,149 @@
+# Array-backed store for the organisms of the genetic algorithm
+
+# Import
+import numpy
+from SubstitutionMatrix import GAP_CODE
+
+class Population:
+    """Organisms held as rows of one preallocated capacity x num_seq x width uint8 array of
+    letter codes, with a fitness vector and a list of free slots.  Columns past the end of a
+    row are gaps (GAP_CODE is 0), so widening every organism by one gap column is just
+    max_len += 1.  lengths holds the logical length of each organism, the number of columns
+    up to its last residue; P[slot] is the organism cut to that length, and every column past
+    it is an implicit trailing gap.  Organisms are addressed by slot number; ids holds a
+    creation number per slot, increasing monotonically, to order organisms independently of
+    slot reuse.  gap_columns holds a capacity x width boolean mask per organism, True where a
+    column is all gaps; the operators keep it up to date as they insert and remove columns."""
+    def __init__(self, capacity, num_seq, max_len, width=None):
+        """Create an empty population; width is the initial number of stored columns and
+        grows as needed (defaults to twice max_len)."""
+        if width is None:
+            width = 2 * max_len
+        self.codes = numpy.full([capacity, num_seq, max(width, max_len+1)], GAP_CODE, dtype=numpy.uint8)
+        self.gap_columns = numpy.ones(self.codes.shape[::2], dtype=bool)
+        self.lengths = numpy.zeros(capacity, dtype=numpy.int64)
+        self.fitness = numpy.zeros(capacity, dtype=numpy.int64)
+        self.alive = numpy.zeros(capacity, dtype=bool)
+        self.ids = numpy.zeros(capacity, dtype=numpy.int64)
+        self.next_id = 0
+        self.free = list(range(capacity-1, -1, -1))
+        self.num_seq = num_seq
+        self.max_len = max_len
+
+    @classmethod
+    def from_dict(cls, D, subst, max_len, capacity=None):
+        """Build a population from a dict of organisms (lists of aligned strings), placing
+        organism key k in slot k; keys must be 0..len(D)-1."""
+        if capacity is None:
+            capacity = len(D)
+        num_seq = len(D[0])
+        longest = max(len(row) for org in D.values() for row in org)
+        P = cls(capacity, num_seq, max_len, max(2 * max_len, longest + 1))
+        for key in sorted(D):
+            P.free.remove(key)
+            P.alive[key] = True
+            P.ids[key] = P.next_id
+            P.next_id += 1
+            for i in range(num_seq):
+                row = subst.encode(D[key][i])
+                P.codes[key, i, :len(row)] = row
+            P.update_gap_columns(key)
+        return P
+
+    def state(self):
+        """Arrays from which from_state rebuilds this population, with the codes cut after
+        the longest organism."""
+        width = max(int(self.lengths.max()), 1)
+        return {'codes': self.codes[:, :, :width], 'fitness': self.fitness, 'alive': self.alive,
+                'ids': self.ids, 'free': numpy.array(self.free, dtype=numpy.int64),
+                'next_id': numpy.array(self.next_id, dtype=numpy.int64)}
+
+    @classmethod
+    def from_state(cls, state, max_len):
+        """Rebuild a population from the arrays returned by state(); slots, ids and the order
+        of free slots are as they were."""
+        codes = state['codes']
+        P = cls(codes.shape[0], codes.shape[1], max_len, max(2 * max_len, codes.shape[2] + 1))
+        P.codes[:, :, :codes.shape[2]] = codes
+        P.fitness[:] = state['fitness']
+        P.alive[:] = state['alive']
+        P.ids[:] = state['ids']
+        P.next_id = int(state['next_id'])
+        P.free = state['free'].tolist()
+        for slot in range(len(P.alive)):
+            P.update_gap_columns(slot)
+        return P
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    def __contains__(self, slot):
+        return 0 <= slot < len(self.alive) and bool(self.alive[slot])
+
+    def __getitem__(self, slot):
+        return self.codes[slot, :, :self.lengths[slot]]
+
+    def keys(self):
+        """Slots of the living organisms, in increasing order."""
+        return numpy.flatnonzero(self.alive).tolist()
+
+    @property
+    def width(self):
+        return self.codes.shape[2]
+
+    def allocate(self):
+        """Take a free slot for a new organism, clearing it to all gaps."""
+        if not self.free:
+            raise IndexError("Population is full")
+        slot = self.free.pop()
+        self.codes[slot] = GAP_CODE
+        self.gap_columns[slot] = True
+        self.lengths[slot] = 0
+        self.fitness[slot] = 0
+        self.alive[slot] = True
+        self.ids[slot] = self.next_id
+        self.next_id += 1
+        return slot
+
+    def release(self, slot):
+        """Remove an organism and return its slot to the free list."""
+        if not self.alive[slot]:
+            raise KeyError(slot)
+        self.alive[slot] = False
+        self.free.append(slot)
+
+    def copy(self, slot, new_slot):
+        """Copy organism slot, with its fitness, into new_slot."""
+        self.codes[new_slot] = self.codes[slot]
+        self.gap_columns[new_slot] = self.gap_columns[slot]
+        self.lengths[new_slot] = self.lengths[slot]
+        self.fitness[new_slot] = self.fitness[slot]
+
+    def update_gap_columns(self, slot):
+        """Recompute the gap column mask and length of organism slot after its rows were
+        rewritten."""
+        self.gap_columns[slot] = ~self.codes[slot].any(axis=0)
+        residues = numpy.flatnonzero(~self.gap_columns[slot])
+        self.lengths[slot] = residues[-1] + 1 if len(residues) else 0
+
+    def reserve(self, width):
+        """Make sure at least width columns are stored, growing the array geometrically."""
+        if width > self.width:
+            grown = numpy.full([self.codes.shape[0], self.num_seq, max(width, 2 * self.width)],
+                               GAP_CODE, dtype=numpy.uint8)
+            grown[:, :, :self.width] = self.codes
+            mask = numpy.ones(grown.shape[::2], dtype=bool)
+            mask[:, :self.width] = self.gap_columns
+            self.codes = grown
+            self.gap_columns = mask
+
+    def extend(self, n=1):
+        """Widen every organism by n trailing gap columns."""
+        self.max_len += n
+        self.reserve(self.max_len + 1)
+
+    def organism(self, slot, subst, max_len=None):
+        """Decode organism slot as a list of aligned strings of max_len columns."""
+        if max_len is None:
+            max_len = self.max_len
+        return [subst.decode(self.codes[slot, i, :max_len]) for i in range(self.num_seq)]
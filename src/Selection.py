@@ -0,0 +1,123 @@
+# Culling and parent selection strategies for the genetic algorithm
+# All of them work on an array-backed Population (see Population.py) in O(pop) or better,
+# without sorting the whole population.  Strategies draw from rng, the random module or a
+# random.Random instance.
+
+# Import
+import random
+import numpy
+
+# Find the n least fit living organisms, lowest fitness first; among equal scores the most
+# recently created organism goes first
+# Input: P, the population; n, number of organisms to cull
+# Output: list of slots
+def least_fit(P, n):
+    keys = numpy.flatnonzero(P.alive)
+    if n <= 0:
+        return []
+    if n >= len(keys):
+        n = len(keys)
+    fitness = P.fitness[keys]
+    # Partial partition finds the n-th lowest score; everything strictly below it is culled,
+    # and ties at that score are broken by creation order
+    threshold = numpy.partition(fitness, n-1)[n-1]
+    below = keys[fitness < threshold]
+    tied = keys[fitness == threshold]
+    tied = tied[numpy.argsort(-P.ids[tied], kind='stable')][:n - len(below)]
+    chosen = numpy.concatenate((below, tied))
+    order = numpy.lexsort((-P.ids[chosen], P.fitness[chosen]))
+    return chosen[order].tolist()
+
+# Remove the n least fit organisms from the population
+# Input: P, the population; n, number of organisms to cull
+# Output: list of the released slots
+def cull_least_fit(P, n):
+    culled = least_fit(P, n)
+    for slot in culled:
+        P.release(slot)
+    return culled
+
+# Find the n most fit living organisms, highest fitness first; among equal scores the oldest
+# organism goes first
+# Input: P, the population; n, number of organisms
+# Output: list of slots
+def fittest(P, n):
+    keys = numpy.flatnonzero(P.alive)
+    if n <= 0:
+        return []
+    if n >= len(keys):
+        n = len(keys)
+    fitness = P.fitness[keys]
+    threshold = numpy.partition(fitness, len(keys)-n)[len(keys)-n]
+    above = keys[fitness > threshold]
+    tied = keys[fitness == threshold]
+    tied = tied[numpy.argsort(P.ids[tied], kind='stable')][:n - len(above)]
+    chosen = numpy.concatenate((above, tied))
+    order = numpy.lexsort((P.ids[chosen], -P.fitness[chosen]))
+    return chosen[order].tolist()
+
+# Find the most fit living organism, the oldest one among equal scores
+def most_fit(P):
+    keys = numpy.flatnonzero(P.alive)
+    fitness = P.fitness[keys]
+    best = keys[fitness == fitness.max()]
+    return int(best[numpy.argmin(P.ids[best])])
+
+class UniformSelection:
+    """Every living organism is equally likely to be picked (the original behaviour)."""
+    def select(self, P, rng=random):
+        return rng.choice(P.keys())
+
+class TruncationSelection:
+    """Pick uniformly among the top fraction of the population."""
+    def __init__(self, fraction=0.5):
+        self.fraction = fraction
+
+    def select(self, P, rng=random):
+        keys = numpy.flatnonzero(P.alive)
+        n = min(len(keys), max(2, int(self.fraction * len(keys))))
+        top = numpy.argpartition(-P.fitness[keys], n-1)[:n]
+        return int(keys[numpy.sort(top)[rng.randint(0, n-1)]])
+
+class TournamentSelection:
+    """Pick the fittest of size organisms drawn uniformly at random."""
+    def __init__(self, size=2):
+        self.size = size
+
+    def select(self, P, rng=random):
+        keys = P.keys()
+        best = rng.choice(keys)
+        for i in range(self.size-1):
+            other = rng.choice(keys)
+            if P.fitness[other] > P.fitness[best]:
+                best = other
+        return best
+
+class RankSelection:
+    """Pick with linearly rank-based probabilities; pressure in [1, 2] is the expected number
+    of picks of the best organism per pick of an average one."""
+    def __init__(self, pressure=1.5):
+        self.pressure = pressure
+
+    def select(self, P, rng=random):
+        keys = numpy.flatnonzero(P.alive)
+        n = len(keys)
+        if n == 1:
+            return int(keys[0])
+        ranks = numpy.arange(n)
+        probs = (2 - self.pressure) / n + 2.0 * ranks * (self.pressure - 1) / (n * (n - 1))
+        rank = min(int(numpy.searchsorted(numpy.cumsum(probs), rng.random(), side='right')), n-1)
+        # Only the organism at the drawn rank is needed, so partition instead of sorting
+        order = numpy.argpartition(P.fitness[keys], rank)
+        return int(keys[order[rank]])
+
+# Select two distinct parents with a selection strategy
+# Input: P, the population; strategy, an object with a select(P, rng) method; rng, the random
+# module or a random.Random instance
+# Output: (mom, dad) slots
+def choose_parents(P, strategy, rng=random):
+    mom = strategy.select(P, rng)
+    dad = strategy.select(P, rng)
+    while mom == dad:
+        dad = strategy.select(P, rng)
+    return mom, dad
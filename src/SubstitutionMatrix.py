@@ -2,18 +2,57 @@
 # Code provided by Prof. Bailey-Kellogg
 # COSC 75, Assignment #1
 # COSC 75, Final Project, MSA_GA
+import numpy
+
+# Gap character and the code reserved for it in encoded sequences
+GAP_CHAR = '-'
+GAP_CODE = 0
+
 class SubstitutionMatrix:
     """Score for substituting one letter for another.  Indexed by a pair of letters; e.g., blosum62['A','R'] => -1"""
     def __init__(self, alphabet, scores):
         """Create a new instance from a list of lists, scores, where the indices follow the order of letters in the alphabet."""
+        self.alphabet = alphabet
         self.matrix = {}
         for i in range(len(alphabet)):
             for j in range(len(alphabet)):
                 self.matrix[alphabet[i],alphabet[j]] = scores[i][j]
+        # Dense table indexed by letter codes; code 0 is the gap and scores 0 against everything
+        self.table = numpy.zeros([len(alphabet)+1, len(alphabet)+1], dtype=numpy.int32)
+        self.table[1:, 1:] = scores
+        self.index = {GAP_CHAR: GAP_CODE}
+        for i in range(len(alphabet)):
+            self.index[alphabet[i]] = i+1
+        # Byte value -> letter code (255 marks letters outside the alphabet), and the reverse
+        self._encoder = numpy.full(256, 255, dtype=numpy.uint8)
+        for letter, code in self.index.items():
+            self._encoder[ord(letter)] = code
+        self._decoder = numpy.frombuffer((GAP_CHAR + alphabet).encode('ascii'), dtype=numpy.uint8)
 
     def __getitem__(self, pair):
         return self.matrix[pair]
 
+    def encode(self, seq):
+        """Encode a sequence (gaps allowed) as a uint8 array of letter codes; e.g., blosum62.encode('AR-') => [1, 2, 0].
+        seq may be a string, ASCII bytes (or bytearray, memoryview) or a FastaRec."""
+        if isinstance(seq, str):
+            raw = seq.encode('ascii')
+        elif isinstance(seq, (bytes, bytearray, memoryview)):
+            raw = seq
+        elif hasattr(seq, '__bytes__'):
+            raw = bytes(seq)
+        else:
+            raw = ''.join(seq).encode('ascii')
+        codes = self._encoder[numpy.frombuffer(raw, dtype=numpy.uint8)]
+        if (codes == 255).any():
+            bad = chr(numpy.frombuffer(raw, dtype=numpy.uint8)[int(numpy.argmax(codes == 255))])
+            raise KeyError(bad)
+        return codes
+
+    def decode(self, codes):
+        """Turn an array of letter codes back into a string."""
+        return self._decoder[numpy.asarray(codes)].tobytes().decode('ascii')
+
 blosum62 = SubstitutionMatrix("ARNDCQEGHILKMFPSTWYV",
                               [[4,-1,-2,-2,0,-1,-1,0,-2,-1,-1,-1,-1,-2,-1,1,0,-3,-2,0],
                                [-1,5,0,-2,-3,1,0,-2,0,-3,-2,2,-1,-3,-2,-1,-1,-3,-2,-3],
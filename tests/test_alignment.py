@@ -0,0 +1,180 @@
+import itertools
+import random
+
+import pytest
+
+from NeedlemanWunsch import nw
+from SubstitutionMatrix import blosum62
+
+LETTERS = 'ARNDCQEGHILKMFPSTWYV'
+
+
+def baseline_matrix(a, b, subst, gap):
+    """Score and backpointer matrices of the original nw(), as lists of lists."""
+    S = [[0] * (len(b)+1) for i in range(len(a)+1)]
+    P = [['n'] * (len(b)+1) for i in range(len(a)+1)]
+    for i in range(len(a)+1):
+        for j in range(len(b)+1):
+            if i == 0 and j == 0:
+                continue
+            elif i == 0:
+                S[i][j], P[i][j] = S[i][j-1] + gap, 'h'
+            elif j == 0:
+                S[i][j], P[i][j] = S[i-1][j] + gap, 'v'
+            else:
+                diagonal = S[i-1][j-1] + subst[a[i-1], b[j-1]]
+                vertical = S[i-1][j] + gap
+                horizontal = S[i][j-1] + gap
+                best = max(diagonal, vertical, horizontal)
+                if best == diagonal:
+                    S[i][j], P[i][j] = diagonal, 'd'
+                elif best == vertical:
+                    S[i][j], P[i][j] = vertical, 'v'
+                else:
+                    S[i][j], P[i][j] = horizontal, 'h'
+    return S, P
+
+
+def baseline_nw(a, b, subst, gap):
+    """The original nw(), including its traceback from cell (len(a)-1, len(b)-1)."""
+    S, P = baseline_matrix(a, b, subst, gap)
+    seq_1 = []
+    seq_2 = []
+    i = len(a)-1
+    j = len(b)-1
+    while P[i][j] != 'n':
+        if P[i][j] == 'd':
+            seq_1.append(a[i])
+            seq_2.append(b[j])
+            i -= 1
+            j -= 1
+        elif P[i][j] == 'v':
+            seq_1.append(a[i])
+            seq_2.append('-')
+            i -= 1
+        elif P[i][j] == 'h':
+            seq_1.append('-')
+            seq_2.append(b[j])
+            j -= 1
+    seq_1.append(a[i])
+    seq_2.append(b[j])
+    return ''.join(reversed(seq_1)), ''.join(reversed(seq_2))
+
+
+def baseline_score(a, b, subst, gap):
+    """Optimal linear-gap score, from the original scoring matrix."""
+    return baseline_matrix(a, b, subst, gap)[0][len(a)][len(b)]
+
+
+def alignment_score(aligned1, aligned2, subst, gap, gap_extend=None):
+    """Score of a pairwise alignment; with gap_extend, a run of L gaps in one row costs
+    gap + (L-1)*gap_extend."""
+    if gap_extend is None:
+        gap_extend = gap
+    score = 0
+    previous = None
+    for (x, y) in zip(aligned1, aligned2):
+        if x == '-' or y == '-':
+            state = 1 if x == '-' else 2
+            score += gap_extend if state == previous else gap
+        else:
+            state = 0
+            score += subst[x, y]
+        previous = state
+    return score
+
+
+def gotoh_score(a, b, subst, gap, gap_extend):
+    """Optimal affine-gap score by the textbook three-matrix recurrence."""
+    low = float('-inf')
+    M = [[low] * (len(b)+1) for i in range(len(a)+1)]
+    X = [[low] * (len(b)+1) for i in range(len(a)+1)]
+    Y = [[low] * (len(b)+1) for i in range(len(a)+1)]
+    M[0][0] = 0
+    for i in range(len(a)+1):
+        for j in range(len(b)+1):
+            if i > 0 and j > 0:
+                M[i][j] = max(M[i-1][j-1], X[i-1][j-1], Y[i-1][j-1]) + subst[a[i-1], b[j-1]]
+            if i > 0:
+                X[i][j] = max(M[i-1][j] + gap, X[i-1][j] + gap_extend, Y[i-1][j] + gap)
+            if j > 0:
+                Y[i][j] = max(M[i][j-1] + gap, Y[i][j-1] + gap_extend, X[i][j-1] + gap)
+    return max(M[len(a)][len(b)], X[len(a)][len(b)], Y[len(a)][len(b)])
+
+
+def all_alignments(a, b):
+    """Every global alignment of a and b."""
+    if not a:
+        yield '-' * len(b), b
+        return
+    if not b:
+        yield a, '-' * len(a)
+        return
+    for (rest1, rest2) in all_alignments(a[1:], b[1:]):
+        yield a[0] + rest1, b[0] + rest2
+    for (rest1, rest2) in all_alignments(a[1:], b):
+        yield a[0] + rest1, '-' + rest2
+    for (rest1, rest2) in all_alignments(a, b[1:]):
+        yield '-' + rest1, b[0] + rest2
+
+
+def random_pairs(seed, count, shortest, longest):
+    rng = random.Random(seed)
+    for n in range(count):
+        a = ''.join(rng.choice(LETTERS) for k in range(rng.randint(shortest, longest)))
+        # Related pairs as well as unrelated ones, so long runs of gaps come up
+        if rng.random() < 0.5:
+            b = ''.join(c for c in a if rng.random() < 0.8)
+            b = b or rng.choice(LETTERS)
+        else:
+            b = ''.join(rng.choice(LETTERS) for k in range(rng.randint(shortest, longest)))
+        yield a, b
+
+
+def check_alignment(aligned1, aligned2, a, b):
+    assert len(aligned1) == len(aligned2)
+    assert aligned1.replace('-', '') == a
+    assert aligned2.replace('-', '') == b
+
+
+def test_vectorized_matches_baseline():
+    for (a, b) in random_pairs(1, 200, 1, 30):
+        for gap in (-4, -8):
+            assert nw(a, b, blosum62, gap, method='vectorized') == baseline_nw(a, b, blosum62, gap)
+
+
+@pytest.mark.parametrize('options', [
+    {'method': 'auto'},
+    {'method': 'auto', 'max_cells': 1},
+    {'method': 'hirschberg'},
+    {'method': 'banded'},
+    {'method': 'banded', 'band': 1},
+])
+def test_optimal_methods_score_as_baseline(options):
+    for (a, b) in random_pairs(2, 150, 1, 40):
+        aligned1, aligned2 = nw(a, b, blosum62, -4, **options)
+        check_alignment(aligned1, aligned2, a, b)
+        assert alignment_score(aligned1, aligned2, blosum62, -4) == baseline_score(a, b, blosum62, -4)
+
+
+def test_gotoh_reference_is_optimal():
+    for (a, b) in random_pairs(3, 60, 1, 4):
+        best = max(alignment_score(x, y, blosum62, -10, -1) for (x, y) in all_alignments(a, b))
+        assert gotoh_score(a, b, blosum62, -10, -1) == best
+
+
+@pytest.mark.parametrize('method', ['vectorized', 'auto'])
+def test_affine_is_optimal(method):
+    for (a, b) in random_pairs(4, 150, 1, 30):
+        for (gap, gap_extend) in ((-10, -1), (-6, -2), (-8, -4)):
+            aligned1, aligned2 = nw(a, b, blosum62, gap, method=method, gap_extend=gap_extend)
+            check_alignment(aligned1, aligned2, a, b)
+            assert (alignment_score(aligned1, aligned2, blosum62, gap, gap_extend)
+                    == gotoh_score(a, b, blosum62, gap, gap_extend))
+
+
+def test_affine_refuses_other_methods_and_large_inputs():
+    with pytest.raises(ValueError):
+        nw('ACDE', 'ACE', blosum62, -10, method='hirschberg', gap_extend=-1)
+    with pytest.raises(ValueError):
+        nw('ACDE', 'ACE', blosum62, -10, method='auto', gap_extend=-1, max_cells=10)
@@ -0,0 +1,40 @@
+import random
+
+from HelperFunctions import vertical_recombination, vertical_recombination_rows
+from Population import Population
+from SubstitutionMatrix import blosum62
+
+
+def random_organism(rng, num_seq, length):
+    rows = []
+    for i in range(num_seq):
+        row = [rng.choice('ARNDCQEGHILKMFPSTWYV-') for k in range(length)]
+        row[rng.randrange(length)] = 'A'
+        rows.append(''.join(row))
+    return rows
+
+
+def test_vertical_recombination_rows_matches_strings():
+    rng = random.Random(7)
+    compared = 0
+    for trial in range(500):
+        num_seq = rng.randint(2, 6)
+        max_len = rng.randint(4, 20)
+        D = {0: random_organism(rng, num_seq, rng.randint(1, max_len)),
+             1: random_organism(rng, num_seq, rng.randint(1, max_len))}
+        P = Population.from_dict(D, blosum62, max_len, capacity=3)
+        # The string operator sees organisms as the array-backed run stores them
+        D = {key: [blosum62.decode(row) for row in P[key]] for key in (0, 1)}
+        l = rng.randint(0, max_len)
+        try:
+            expected = vertical_recombination(D, 0, 1, l, num_seq, max_len)
+        except IndexError:
+            # The string operator cannot cut rows with fewer than l residues
+            continue
+        child = P.allocate()
+        vertical_recombination_rows(P, 0, 1, child, l, num_seq)
+        # Trailing gaps are implicit in the array-backed rows
+        assert ([blosum62.decode(row).rstrip('-') for row in P.codes[child]]
+                == [row.rstrip('-') for row in expected])
+        compared += 1
+    assert compared > 100
@@ -0,0 +1,57 @@
+import operator
+import random
+
+from FitnessModel import FitnessModel
+from HelperFunctions import calc_fitness, initial_fitness
+from SubstitutionMatrix import blosum62
+
+
+def baseline_calc_fitness(organism, subst, gap, max_len):
+    """calc_fitness as it was before scoring was vectorized."""
+    total_score = 0
+    for i in range(len(organism)):
+        for j in range(i+1, len(organism)):
+            score = 0
+            for k in range(max_len):
+                if operator.xor(bool(organism[i][k] == '-'), bool(organism[j][k] == '-')):
+                    if organism[i][k] != organism[i][j]:
+                        score += gap
+                elif organism[i][k] != '-' and organism[j][k] != '-':
+                    score += subst[organism[i][k], organism[j][k]]
+            total_score += score
+    return total_score
+
+
+def random_organism(rng, num_seq, length):
+    return [''.join(rng.choice('ARNDCQEGHILKMFPSTWYV---') for k in range(length))
+            for i in range(num_seq)]
+
+
+def test_legacy_fitness_matches_baseline():
+    rng = random.Random(6)
+    for trial in range(200):
+        num_seq = rng.randint(2, 12)
+        length = rng.randint(num_seq, 30)
+        organism = random_organism(rng, num_seq, length)
+        max_len = rng.randint(1, length)
+        assert (calc_fitness(organism, blosum62, -4, max_len, legacy=True)
+                == baseline_calc_fitness(organism, blosum62, -4, max_len))
+
+
+def test_legacy_fitness_of_short_alignment_with_many_sequences():
+    # Fewer columns scored than sequences: the baseline reads letters past max_len
+    rng = random.Random(7)
+    organism = random_organism(rng, 10, 12)
+    for max_len in (1, 3, 9):
+        expected = baseline_calc_fitness(organism, blosum62, -4, max_len)
+        assert calc_fitness(organism, blosum62, -4, max_len, legacy=True) == expected
+        assert initial_fitness({0: organism}, 1, blosum62, -4, max_len, legacy=True)[0] == expected
+
+
+def test_legacy_fitness_model_of_narrow_organism():
+    rng = random.Random(8)
+    organism = random_organism(rng, 10, 4)
+    # Rows shorter than the number of sequences end in implicit gaps
+    padded = [row + '-' * 6 for row in organism]
+    model = FitnessModel(blosum62, -4, legacy=True)
+    assert model.score(0, organism, 4) == baseline_calc_fitness(padded, blosum62, -4, 4)